@@ -0,0 +1,215 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.cache import aget_recipe_entry, aget_reference_entry
+from api.filters import RecipeFilter
+from api.pagination import RecipePagination
+from api.serializers import RecipeSerializer
+from api.views import (SHOPPING_CART_DISPOSITION, shopping_cart_ingredients,
+                       shopping_cart_line)
+from api.viewsets import (anonymous_cache_query, cached_recipe_response,
+                          reference_response)
+from recipes.memberships import get_memberships
+from recipes.models import Recipe
+
+
+async def aauthenticate(request):
+    """Пользователь по заголовку Authorization: Token <ключ>.
+
+    Возвращает None для неверного заголовка или токена: такой запрос
+    обрабатывает синхронный вьюсет, который и ответит 401.
+    """
+    header = request.headers.get('Authorization', '').split()
+    if not header or header[0].lower() != 'token':
+        return AnonymousUser()
+    if len(header) != 2:
+        return None
+    token = await Token.objects.select_related('user').filter(
+        key=header[1]
+    ).afirst()
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    """Ответ в JSON, совпадающий с выводом JSONRenderer DRF."""
+    return HttpResponse(JSONRenderer().render(data), status=status_code,
+                        content_type='application/json')
+
+
+class AsyncReadView(View):
+    """Асинхронный GET в JSON, остальное - синхронным вьюсетом.
+
+    sync_view получает другие методы, браузерный API, неверные токены
+    и анонимов при authenticated_only, поэтому их ответы и ошибки
+    те же, что без ASGI. Исключения DRF из get переводятся в ответ,
+    как в exception_handler.
+    """
+
+    sync_view = None
+    authenticated_only = False
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        """Токены не требуют CSRF, как во вьюсетах DRF."""
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Выбрать асинхронный или синхронный обработчик."""
+        if request.method == 'GET' and self.accepts_json(request):
+            user = await aauthenticate(request)
+            if user is not None and (user.is_authenticated
+                                     or not self.authenticated_only):
+                request.user = user
+                try:
+                    return await self.get(request, *args, **kwargs)
+                except exceptions.APIException as exc:
+                    detail = exc.detail
+                    if not isinstance(detail, (list, dict)):
+                        detail = {'detail': detail}
+                    return json_response(detail, exc.status_code)
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    @staticmethod
+    def accepts_json(request):
+        """Клиент не просит браузерный API."""
+        return (request.GET.get('format', 'json') == 'json'
+                and 'text/html' not in request.headers.get('Accept', ''))
+
+
+class ReferenceListView(AsyncReadView):
+    """Список справочника с кешем и ETag, как CachedReferenceViewSet."""
+
+    model = None
+    serializer_class = None
+    filterset_class = None
+    cache_namespace = None
+
+    async def get(self, request):
+        """Отдать список из кеша или ответить 304."""
+        query = request.GET.urlencode()
+        etag, body = await aget_reference_entry(
+            self.cache_namespace,
+            '&'.join(sorted(query.split('&'))),
+            lambda: self.render(request),
+        )
+        return reference_response(request, etag, body)
+
+    async def render(self, request):
+        """Прочитать справочник асинхронным ORM."""
+        queryset = self.model.objects.all()
+        if self.filterset_class is not None:
+            filterset = self.filterset_class(request.GET, queryset=queryset)
+            if not filterset.is_valid():
+                raise exceptions.ValidationError(filterset.errors)
+            queryset = filterset.qs
+        return JSONRenderer().render(self.serializer_class(
+            [obj async for obj in queryset], many=True
+        ).data)
+
+
+class ReferenceDetailView(AsyncReadView):
+    """Одна запись справочника."""
+
+    model = None
+    serializer_class = None
+
+    async def get(self, request, pk):
+        """Получить запись асинхронным ORM."""
+        obj = await self.model.objects.filter(pk=pk).afirst()
+        if obj is None:
+            raise exceptions.NotFound()
+        return json_response(self.serializer_class(obj).data)
+
+
+class RecipeReadView(AsyncReadView):
+    """Список и карточка рецепта, как в RecipeViewSet.
+
+    Ответы анонимам берутся из общего с RecipeViewSet кеша.
+    """
+
+    async def get(self, request, pk=None):
+        """Отдать рецепты из кеша или собрать ответ."""
+        drf_request = Request(request)
+        drf_request.user = request.user
+        if request.user.is_authenticated:
+            return json_response(await self.render_data(drf_request, pk))
+        response = None
+
+        async def render():
+            nonlocal response
+            try:
+                return JSONRenderer().render(
+                    await self.render_data(drf_request, pk)
+                )
+            except exceptions.NotFound as exc:
+                response = json_response({'detail': exc.detail},
+                                         exc.status_code)
+                return None
+
+        body, hit = await aget_recipe_entry(
+            pk, anonymous_cache_query(request), render
+        )
+        if body is None:
+            return response
+        return cached_recipe_response(body, hit)
+
+    async def render_data(self, request, pk):
+        """Данные списка или карточки рецепта."""
+        user = request.user
+        queryset = Recipe.objects.with_related()
+        context = {'request': request}
+        if user.is_authenticated:
+            context['memberships'] = await sync_to_async(get_memberships)(
+                user
+            )
+        else:
+            queryset = queryset.with_user_flags(user)
+        if pk is not None:
+            recipe = await queryset.filter(pk=pk).afirst()
+            if recipe is None:
+                raise exceptions.NotFound()
+            return RecipeSerializer(recipe, context=context).data
+        filterset = RecipeFilter(request.query_params, queryset=queryset,
+                                 request=request)
+        if not filterset.is_valid():
+            raise exceptions.ValidationError(filterset.errors)
+        paginator = RecipePagination()
+        page = await sync_to_async(paginator.paginate_queryset)(
+            filterset.qs, request
+        )
+        if page is None:
+            return RecipeSerializer([recipe async for recipe in filterset.qs],
+                                    many=True, context=context).data
+        return paginator.get_paginated_response(
+            RecipeSerializer(page, many=True, context=context).data
+        ).data
+
+
+class ShoppingCartView(AsyncReadView):
+    """Список покупок частями из aiterator, без потока на клиента."""
+
+    authenticated_only = True
+
+    async def get(self, request):
+        """Скачать список покупок."""
+        ingredients = shopping_cart_ingredients(request.user)
+
+        async def content():
+            async for item in ingredients.aiterator():
+                yield shopping_cart_line(item)
+
+        response = StreamingHttpResponse(content(),
+                                         content_type='text/plain')
+        response['Content-Disposition'] = SHOPPING_CART_DISPOSITION
+        return response
@@ -0,0 +1,57 @@
+import threading
+from bisect import bisect_left
+
+from api.cache import get_reference_version
+from recipes.models import Ingredient
+
+
+class IngredientAutocomplete:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированные по имени в нижнем регистре ингредиенты,
+    поэтому префиксный поиск - это бинарный поиск, а поиск по вхождению -
+    проход по ~2 тыс. строк без обращения к базе.
+    Перестраивается при следующем запросе после смены версии
+    справочника ингредиентов в кеше.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = None
+        self._items = None
+
+    def _load(self):
+        """Построить индекс, если сменилась версия справочника."""
+        version = get_reference_version('ingredients')
+        with self._lock:
+            if self._version != version:
+                items = sorted(
+                    Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit'
+                    ),
+                    key=lambda item: (item['name'].lower(), item['id'])
+                )
+                self._items = items
+                self._keys = [item['name'].lower() for item in items]
+                self._version = version
+            return self._keys, self._items
+
+    def search(self, query, limit=None):
+        """Найти ингредиенты: сначала по началу имени, затем по вхождению."""
+        keys, items = self._load()
+        query = query.lower()
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        result = items[start:end]
+        if limit is None or len(result) < limit:
+            result += [
+                item for key, item in zip(keys, items)
+                if query in key and not key.startswith(query)
+            ]
+        return result[:limit]
+
+
+ingredient_autocomplete = IngredientAutocomplete()
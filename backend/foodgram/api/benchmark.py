@@ -0,0 +1,422 @@
+import gc
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, setup_test_environment,
+                               teardown_test_environment)
+from django.urls import URLResolver, reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.urls import urlpatterns
+from recipes.counters import reconcile_counters
+from recipes.images import get_executor
+from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingList, Tag, TagRecipe)
+from recipes.search import update_search_vectors
+from recipes.trending import update_trending_scores
+from users.models import User
+
+BATCH_SIZE = 5000
+PASSWORD = 'benchmark-Password-1'
+PNG_1PX = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1Pe'
+    'AAAADElEQVR4nGP4//8/AAX+Av4N70a4AAAAAElFTkSuQmCC'
+)
+EXCLUDED_ROUTES = {
+    'user-activation': 'письмо активации djoser',
+    'user-resend-activation': 'письмо активации djoser',
+    'user-reset-password': 'письмо сброса пароля djoser',
+    'user-reset-password-confirm': 'письмо сброса пароля djoser',
+    'user-reset-username': 'письмо сброса логина djoser',
+    'user-reset-username-confirm': 'письмо сброса логина djoser',
+    'user-set-password': 'время уходит на хеширование пароля',
+    'user-set-username': 'меняет учетные данные читателя',
+}
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    """Отдельная тестовая база на время замера и временный каталог.
+
+    SQLite создается файлом во временном каталоге, а не в общей
+    памяти: потоки обработки фото и другие процессы ждут блокировку,
+    а не падают с ошибкой.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if connection.vendor == 'sqlite' and not keepdb:
+            connection.settings_dict['TEST']['NAME'] = str(
+                Path(temp_dir) / 'benchmark.sqlite3'
+            )
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=keepdb
+        )
+        try:
+            yield temp_dir
+        finally:
+            get_executor().shutdown(wait=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0,
+                                                keepdb=keepdb)
+            teardown_test_environment()
+
+
+class BenchmarkData:
+    """Синтетические данные заданного масштаба.
+
+    Все пользователи - авторы. Первый - администратор, второй -
+    читатель, от имени которого идут запросы, последний входит
+    и выходит в сценариях токена.
+    """
+
+    def __init__(self, users, recipes, ingredients, ingredients_per_recipe,
+                 tags, favorites, cart, follows):
+        self.scale = {
+            'users': users,
+            'recipes': recipes,
+            'ingredients': ingredients,
+            'ingredients_per_recipe': ingredients_per_recipe,
+            'tags': tags,
+            'favorites': favorites,
+            'cart': cart,
+            'follows': follows,
+        }
+        self.random = random.Random(0)
+
+    def seed(self):
+        """Заполнить базу и подготовить объекты для сценариев."""
+        scale = self.scale
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (User(username=f'benchmark-{index}',
+                  email=f'benchmark-{index}@example.com',
+                  first_name='Имя', last_name='Фамилия',
+                  password=password, is_staff=index == 0)
+             for index in range(scale['users'])),
+            batch_size=BATCH_SIZE,
+        )
+        users = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {index}', slug=f'benchmark-{index}',
+                color=f'#{index:06x}')
+            for index in range(scale['tags'])
+        )
+        tags = list(Tag.objects.values_list('pk', flat=True))
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+             for index in range(scale['ingredients'])),
+            batch_size=BATCH_SIZE,
+        )
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        Recipe.objects.bulk_create(
+            (Recipe(name=f'Рецепт {index}', text='Описание рецепта',
+                    cooking_time=1 + index % 120,
+                    author_id=users[index % len(users)])
+             for index in range(scale['recipes'])),
+            batch_size=BATCH_SIZE,
+        )
+        recipes = list(Recipe.objects.values_list('pk', flat=True))
+        self._seed_links(recipes, tags, ingredients)
+        self._seed_relations(users, recipes)
+        reconcile_counters()
+        update_search_vectors()
+        update_trending_scores()
+        self._build_similar()
+        self.admin = User.objects.get(pk=users[0])
+        self.reader = User.objects.get(pk=users[1])
+        self.guest = User.objects.get(pk=users[-1])
+        self.recipe = Recipe.objects.filter(author=self.reader).first()
+        self.other_recipe = Recipe.objects.exclude(
+            favorite_recipe__user=self.reader
+        ).exclude(shopping_recipe__user=self.reader).first()
+        self.other_author = User.objects.exclude(
+            following__user=self.reader
+        ).exclude(pk=self.reader.pk).first()
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        self.ingredient_ids = ingredients[:scale['ingredients_per_recipe']]
+
+    def _seed_links(self, recipes, tags, ingredients):
+        """Связать рецепты с тегами и ингредиентами."""
+        per_recipe = min(self.scale['ingredients_per_recipe'],
+                         len(ingredients))
+        TagRecipe.objects.bulk_create(
+            (TagRecipe(recipe_id=recipe, tag_id=tag)
+             for recipe in recipes
+             for tag in self.random.sample(tags, min(2, len(tags)))),
+            batch_size=BATCH_SIZE,
+        )
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                              amount=self.random.randint(1, 500))
+             for recipe in recipes
+             for ingredient in self.random.sample(ingredients, per_recipe)),
+            batch_size=BATCH_SIZE,
+        )
+
+    def _seed_relations(self, users, recipes):
+        """Создать избранное, списки покупок и подписки."""
+        favorites = min(self.scale['favorites'], len(recipes) - 1)
+        cart = min(self.scale['cart'], len(recipes) - 1)
+        follows = min(self.scale['follows'], len(users) - 2)
+        for model, count in ((Favorite, favorites), (ShoppingList, cart)):
+            model.objects.bulk_create(
+                (model(user_id=user, recipe_id=recipe)
+                 for user in users
+                 for recipe in self.random.sample(recipes, count)),
+                batch_size=BATCH_SIZE,
+            )
+        Follow.objects.bulk_create(
+            (Follow(user_id=user, following_id=author)
+             for user in users
+             for author in self.random.sample(users, follows)
+             if author != user),
+            batch_size=BATCH_SIZE,
+        )
+
+    def _build_similar(self):
+        """Рассчитать похожие рецепты, если установлены NumPy и SciPy."""
+        try:
+            from recipes.similarity import build_similar_recipes
+        except ImportError:
+            return
+        build_similar_recipes(top_k=10, rebuild=True)
+
+
+class Scenario:
+    """Запрос к маршруту API от имени анонима, читателя или админа.
+
+    prepare вызывается перед каждым запросом вне замера и возвращает
+    состояние, из которого kwargs и data строят адрес и тело.
+    cleanup возвращает базу в исходное состояние после запроса.
+    check проверяет тело ответа, если одного статуса мало.
+    """
+
+    def __init__(self, route, method='get', user='reader', label=None,
+                 kwargs=None, query=None, data=None, status=200,
+                 prepare=None, cleanup=None, check=None):
+        self.route = route
+        self.method = method
+        self.user = user
+        self.label = label or f'{route} {method.upper()} {user}'
+        self.kwargs = kwargs
+        self.query = query
+        self.data = data
+        self.status = status
+        self.prepare = prepare
+        self.cleanup = cleanup
+        self.check = check
+
+    def request(self, client, iteration):
+        """Выполнить запрос и вернуть ответ с прочитанным телом."""
+        state = self.prepare(iteration) if self.prepare else iteration
+        path = reverse(self.route, kwargs=_resolve(self.kwargs, state))
+        if self.query:
+            path = f'{path}?{urlencode(self.query, doseq=True)}'
+        data = _resolve(self.data, state)
+        start = time.perf_counter()
+        response = getattr(client, self.method)(path, data, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+        if self.cleanup:
+            self.cleanup(state)
+        return response, elapsed
+
+
+def _resolve(value, state):
+    """Вычислить параметр сценария, заданный функцией от состояния."""
+    return value(state) if callable(value) else value
+
+
+def build_scenarios(data):
+    """Сценарии для всех маршрутов api/urls.py."""
+    reader, recipe = data.reader, data.recipe
+    other_recipe, other_author = data.other_recipe, data.other_author
+    recipe_payload = {
+        'text': 'Описание рецепта',
+        'cooking_time': 10,
+        'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+        'ingredients': [{'id': pk, 'amount': 10}
+                        for pk in data.ingredient_ids],
+    }
+
+    def create_recipe(iteration):
+        new = Recipe.objects.create(
+            name=f'Удаляемый рецепт {iteration}', author=reader,
+            text='Описание рецепта', cooking_time=1,
+        )
+        return {'pk': new.pk}
+
+    def relation(model, **fields):
+        return {
+            'prepare': lambda _: model.objects.create(user=reader, **fields),
+            'cleanup': lambda _: model.objects.filter(
+                user=reader, **fields
+            ).delete(),
+        }
+
+    return [
+        Scenario('api-root', user='anon'),
+        Scenario('ingredients-list', user='anon',
+                 query={'name': 'Ингредиент 1'}),
+        Scenario('ingredients-detail', user='anon',
+                 kwargs={'pk': data.ingredient_ids[0]}),
+        Scenario('ingredients-autocomplete', user='anon',
+                 query={'name': 'Ингредиент 1', 'limit': 10}),
+        Scenario('tags-list', user='anon'),
+        Scenario('tags-detail', user='anon',
+                 kwargs={'pk': Tag.objects.values_list('pk',
+                                                       flat=True)[0]}),
+        Scenario('user-list'),
+        Scenario('user-list', 'post', user='anon', status=201,
+                 data=lambda iteration: {
+                     'email': f'new-{iteration}@example.com',
+                     'username': f'new-{iteration}',
+                     'first_name': 'Имя', 'last_name': 'Фамилия',
+                     'password': PASSWORD,
+                 },
+                 cleanup=lambda iteration: User.objects.filter(
+                     username=f'new-{iteration}'
+                 ).delete()),
+        Scenario('user-detail', kwargs={'id': other_author.pk}),
+        Scenario('user-me'),
+        Scenario('login', 'post', user='anon',
+                 data={'email': data.guest.email, 'password': PASSWORD}),
+        Scenario('logout', 'post', user='guest', status=204),
+        Scenario('get_subscribe-list', query={'recipes_limit': 3,
+                                              'limit': 6}),
+        Scenario('subscribe', 'post', status=201,
+                 kwargs={'user_id': other_author.pk},
+                 cleanup=lambda _: Follow.objects.filter(
+                     user=reader, following=other_author
+                 ).delete()),
+        Scenario('subscribe', 'delete', status=204,
+                 kwargs={'user_id': other_author.pk},
+                 prepare=lambda _: Follow.objects.create(
+                     user=reader, following=other_author
+                 )),
+        Scenario('recipes-list', user='anon', query={'limit': 6}),
+        Scenario('recipes-list', query={'limit': 6}),
+        Scenario('recipes-list', label='recipes-list GET reader favorited',
+                 query={'limit': 6, 'is_favorited': 1}),
+        Scenario('recipes-list', label='recipes-list GET reader tags',
+                 query={'limit': 6, 'tags': data.tag_slugs}),
+        Scenario('recipes-list', label='recipes-list GET reader search',
+                 query={'limit': 6, 'search': 'Рецепт'}),
+        Scenario('recipes-list', label='recipes-list GET reader popular',
+                 query={'limit': 6, 'ordering': 'popular'}),
+        Scenario('recipes-list', label='recipes-list GET reader cursor',
+                 query={'limit': 6, 'pagination': 'cursor'}),
+        Scenario('recipes-list', 'post', status=201,
+                 data=lambda iteration: dict(
+                     recipe_payload, image=PNG_1PX,
+                     name=f'Новый рецепт {iteration}',
+                 ),
+                 cleanup=lambda iteration: Recipe.objects.filter(
+                     name=f'Новый рецепт {iteration}'
+                 ).delete()),
+        Scenario('recipes-detail', user='anon', kwargs={'pk': recipe.pk}),
+        Scenario('recipes-detail', kwargs={'pk': recipe.pk}),
+        Scenario('recipes-detail', 'patch', kwargs={'pk': recipe.pk},
+                 data=dict(recipe_payload, name=recipe.name)),
+        Scenario('recipes-detail', 'delete', status=204,
+                 kwargs=lambda state: state, prepare=create_recipe),
+        Scenario('recipes-bulk', 'post', user='admin',
+                 data=lambda iteration: [
+                     dict(recipe_payload, image=PNG_1PX,
+                          name=f'Пакет {iteration}-{index}')
+                     for index in range(10)
+                 ],
+                 check=lambda response: response.data['created'] == 10,
+                 cleanup=lambda iteration: Recipe.objects.filter(
+                     name__startswith=f'Пакет {iteration}-'
+                 ).delete()),
+        Scenario('recipes-by-ingredients',
+                 query={'ingredients': data.ingredient_ids}),
+        Scenario('recipes-feed', query={'limit': 6}),
+        Scenario('recipes-similar', user='anon', kwargs={'pk': recipe.pk}),
+        Scenario('recipes-cache-stats', user='admin'),
+        Scenario('metrics', user='admin'),
+        Scenario('download_shopping_cart'),
+        Scenario('favorite', 'post', status=201,
+                 kwargs={'recipe_id': other_recipe.pk},
+                 cleanup=relation(Favorite, recipe=other_recipe)['cleanup']),
+        Scenario('favorite', 'delete', status=204,
+                 kwargs={'recipe_id': other_recipe.pk},
+                 prepare=relation(Favorite, recipe=other_recipe)['prepare']),
+        Scenario('shopping', 'post', status=201,
+                 kwargs={'recipe_id': other_recipe.pk},
+                 cleanup=relation(ShoppingList,
+                                  recipe=other_recipe)['cleanup']),
+        Scenario('shopping', 'delete', status=204,
+                 kwargs={'recipe_id': other_recipe.pk},
+                 prepare=relation(ShoppingList,
+                                  recipe=other_recipe)['prepare']),
+    ]
+
+
+def route_names(patterns=urlpatterns):
+    """Имена всех маршрутов api/urls.py."""
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= route_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def get_client(data, user):
+    """Клиент API от имени пользователя сценария."""
+    client = APIClient()
+    if user != 'anon':
+        token, _ = Token.objects.get_or_create(user=getattr(data, user))
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def run_scenario(data, scenario, repeat, warmup):
+    """Замерить запросы к базе, задержку и пик выделенной памяти."""
+    queries, timings = [], []
+    gc.collect()
+    for iteration in range(warmup + repeat + 1):
+        client = get_client(data, scenario.user)
+        measure_memory = iteration == warmup + repeat
+        if measure_memory:
+            tracemalloc.start()
+        # Сборка мусора отключена на время запроса, как в timeit,
+        # чтобы ее паузы не попадали в задержку.
+        gc.disable()
+        try:
+            with CaptureQueriesContext(connection) as context:
+                response, elapsed = scenario.request(client, iteration)
+        finally:
+            gc.enable()
+        if measure_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if (response.status_code != scenario.status
+                or scenario.check and not scenario.check(response)):
+            raise AssertionError(
+                f'{scenario.label}: {response.status_code} '
+                f'{getattr(response, "content", b"")[:500]!r}'
+            )
+        if warmup <= iteration < warmup + repeat:
+            queries.append(len(context))
+            timings.append(elapsed * 1000)
+    timings.sort()
+    return {
+        'queries': max(queries),
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1,
+                                    int(len(timings) * 0.95))], 2),
+        'alloc_kib': round(peak / 1024, 1),
+    }
@@ -0,0 +1,152 @@
+import time
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+
+from api.cache import bump_recipe_versions
+from api.serializers import RecipeBulkItemSerializer
+from recipes.counters import reconcile_counters
+from recipes.images import schedule_renditions
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag, TagRecipe
+from recipes.search import update_search_vectors
+from users.models import User
+
+DEFAULT_BATCH_SIZE = 500
+NAME_TAKEN = 'Рецепт с таким названием уже существует.'
+
+
+class RecipeBulkCreator:
+    """Пакетное создание рецептов.
+
+    Рецепты проверяются пачками: теги, ингредиенты и занятые названия
+    всей пачки загружаются одним запросом каждый, затем корректные рецепты
+    и их связи вставляются через bulk_create в транзакции на пачку.
+    """
+
+    def __init__(self, author, batch_size=DEFAULT_BATCH_SIZE, context=None):
+        self.author = author
+        self.batch_size = batch_size
+        self.context = context or {}
+
+    def run(self, items):
+        """Создать рецепты и вернуть результат по каждому и статистику."""
+        start = time.perf_counter()
+        results = []
+        iterator = iter(items)
+        batch = list(islice(iterator, self.batch_size))
+        while batch:
+            results.extend(self._create_batch(batch, len(results)))
+            batch = list(islice(iterator, self.batch_size))
+        reconcile_counters({User: [self.author.pk]})
+        bump_recipe_versions()
+        elapsed = time.perf_counter() - start
+        created = sum(1 for result in results if 'id' in result)
+        return {
+            'created': created,
+            'failed': len(results) - created,
+            'elapsed': round(elapsed, 3),
+            'per_second': round(created / elapsed, 1) if elapsed else None,
+            'results': results,
+        }
+
+    def _prefetch(self, batch):
+        """Загрузить теги и ингредиенты всей пачки."""
+        tag_ids, ingredient_ids = set(), set()
+        for item in batch:
+            if not isinstance(item, dict):
+                continue
+            tags = item.get('tags')
+            if isinstance(tags, list):
+                tag_ids.update(tag for tag in tags if isinstance(tag, int))
+            ingredients = item.get('ingredients')
+            if isinstance(ingredients, list):
+                ingredient_ids.update(
+                    ingredient.get('id') for ingredient in ingredients
+                    if isinstance(ingredient, dict)
+                    and isinstance(ingredient.get('id'), int)
+                )
+        return {
+            Tag: Tag.objects.in_bulk(tag_ids),
+            Ingredient: Ingredient.objects.in_bulk(ingredient_ids),
+        }
+
+    def _validate_batch(self, batch, offset):
+        """Проверить пачку, вернув корректные данные и ошибки."""
+        context = dict(self.context, prefetched=self._prefetch(batch))
+        valid, results = [], []
+        for index, item in enumerate(batch, offset):
+            serializer = RecipeBulkItemSerializer(data=item, context=context)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+                results.append({'index': index})
+            else:
+                results.append({'index': index, 'errors': serializer.errors})
+        names = [data['name'] for _, data in valid]
+        taken = set(Recipe.objects.filter(
+            name__in=names
+        ).values_list('name', flat=True))
+        unique = []
+        for index, data in valid:
+            if data['name'] in taken:
+                results[index - offset]['errors'] = {'name': [NAME_TAKEN]}
+                continue
+            taken.add(data['name'])
+            unique.append((index, data))
+        return unique, results
+
+    def _create_batch(self, batch, offset):
+        """Создать корректные рецепты пачки в одной транзакции.
+
+        Если название заняли параллельно после проверки, пачка
+        откатывается и вставляется по одному рецепту в точках
+        сохранения, а занятые названия попадают в ошибки.
+        """
+        valid, results = self._validate_batch(batch, offset)
+        items = []
+        for index, data in valid:
+            data = dict(data)
+            tags = data.pop('tags')
+            ingredients = data.pop('ingredientinrecipe_set')
+            items.append((index, Recipe(author=self.author, **data), tags,
+                          ingredients))
+        try:
+            with transaction.atomic():
+                self._insert(items)
+            inserted = items
+        except IntegrityError:
+            inserted = []
+            for item in items:
+                index, recipe = item[:2]
+                recipe.pk = None
+                recipe._state.adding = True
+                try:
+                    with transaction.atomic():
+                        self._insert([item])
+                except IntegrityError:
+                    results[index - offset]['errors'] = {'name': [NAME_TAKEN]}
+                    recipe.image.delete(save=False)
+                else:
+                    inserted.append(item)
+        for index, recipe, _, _ in inserted:
+            results[index - offset]['id'] = recipe.pk
+        return results
+
+    def _insert(self, items):
+        """Вставить рецепты и их связи."""
+        recipes = [recipe for _, recipe, _, _ in items]
+        Recipe.objects.bulk_create(recipes)
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag=tag)
+            for _, recipe, tags, _ in items
+            for tag in tags
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe,
+                             ingredient=ingredient['ingredient'],
+                             amount=ingredient['amount'])
+            for _, recipe, _, ingredients in items
+            for ingredient in ingredients
+        )
+        update_search_vectors([recipe.pk for recipe in recipes])
+        for recipe in recipes:
+            schedule_renditions(recipe)
@@ -0,0 +1,162 @@
+import hashlib
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+REFERENCE_VERSION_KEY = 'reference:{namespace}:version'
+REFERENCE_ENTRY_KEY = 'reference:{namespace}:{version}:{query}'
+REFERENCE_ENTRY_TIMEOUT = 60 * 60 * 24
+RECIPES_NAMESPACE = 'recipes'
+RECIPE_LIST_NAMESPACE = 'recipes:list'
+RECIPE_DETAIL_NAMESPACE = 'recipes:{recipe_id}'
+RECIPE_ENTRY_KEY = 'recipes:{versions}:{query}'
+RECIPE_STATS_KEY = 'recipes:stats:{result}'
+RECIPE_STATS_RESULTS = ('hits', 'misses')
+
+
+def get_reference_version(namespace):
+    """Получить текущую версию справочника."""
+    key = REFERENCE_VERSION_KEY.format(namespace=namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_reference_version(namespace):
+    """Сменить версию справочника после коммита транзакции.
+
+    Со сменой до коммита читатель успел бы закешировать прежние
+    строки под новой версией на все время жизни записи.
+    """
+    transaction.on_commit(lambda: cache.set(
+        REFERENCE_VERSION_KEY.format(namespace=namespace),
+        uuid4().hex, timeout=None,
+    ))
+
+
+def lookup_reference_entry(namespace, query):
+    """Ключ записи справочника и запись (None при промахе)."""
+    key = REFERENCE_ENTRY_KEY.format(
+        namespace=namespace,
+        version=get_reference_version(namespace),
+        query=query,
+    )
+    return key, cache.get(key)
+
+
+def make_reference_entry(body):
+    """Запись справочника: ETag по содержимому и тело."""
+    return '"{0}"'.format(hashlib.sha256(body).hexdigest()), body
+
+
+def get_reference_entry(namespace, query, render):
+    """Получить ETag и готовое тело ответа справочника.
+
+    render вызывается только при промахе и должен вернуть байты ответа.
+    """
+    key, entry = lookup_reference_entry(namespace, query)
+    if entry is None:
+        entry = make_reference_entry(render())
+        cache.set(key, entry, timeout=REFERENCE_ENTRY_TIMEOUT)
+    return entry
+
+
+async def aget_reference_entry(namespace, query, render):
+    """Асинхронный get_reference_entry, render - корутина."""
+    key, entry = await sync_to_async(lookup_reference_entry)(namespace, query)
+    if entry is None:
+        entry = make_reference_entry(await render())
+        await cache.aset(key, entry, timeout=REFERENCE_ENTRY_TIMEOUT)
+    return entry
+
+
+def bump_recipe_versions(recipe_ids=(), everything=False):
+    """Сбросить кеш ответов по рецептам после коммита транзакции.
+
+    Всегда сбрасываются списки и перечисленные рецепты,
+    everything сбрасывает и все карточки рецептов.
+    """
+    namespaces = [RECIPES_NAMESPACE if everything else RECIPE_LIST_NAMESPACE]
+    namespaces.extend(RECIPE_DETAIL_NAMESPACE.format(recipe_id=recipe_id)
+                      for recipe_id in recipe_ids)
+    transaction.on_commit(lambda: cache.set_many(
+        {REFERENCE_VERSION_KEY.format(namespace=namespace): uuid4().hex
+         for namespace in namespaces},
+        timeout=None,
+    ))
+
+
+def lookup_recipe_entry(recipe_id, query):
+    """Ключ ответа со списком или одним рецептом и тело (None при промахе).
+
+    Ключ включает версии всех рецептов и списков либо карточки
+    recipe_id. Попадания и промахи учитываются в счетчиках.
+    """
+    namespace = (
+        RECIPE_LIST_NAMESPACE if recipe_id is None
+        else RECIPE_DETAIL_NAMESPACE.format(recipe_id=recipe_id)
+    )
+    key = RECIPE_ENTRY_KEY.format(
+        versions=':'.join((get_reference_version(RECIPES_NAMESPACE),
+                           get_reference_version(namespace))),
+        query=query,
+    )
+    body = cache.get(key)
+    _count_recipe_entry('misses' if body is None else 'hits')
+    return key, body
+
+
+def get_recipe_entry(recipe_id, query, render):
+    """Получить готовое тело ответа со списком или одним рецептом.
+
+    render вызывается при промахе и возвращает байты ответа или None,
+    если ответ кешировать нельзя. Возвращает пару
+    (тело, попадание в кеш).
+    """
+    key, body = lookup_recipe_entry(recipe_id, query)
+    if body is not None:
+        return body, True
+    body = render()
+    if body is not None:
+        cache.set(key, body, timeout=settings.RECIPE_RESPONSE_CACHE_TIMEOUT)
+    return body, False
+
+
+async def aget_recipe_entry(recipe_id, query, render):
+    """Асинхронный get_recipe_entry, render - корутина.
+
+    Версии и тело читаются за один переход в синхронный поток.
+    """
+    key, body = await sync_to_async(lookup_recipe_entry)(recipe_id, query)
+    if body is not None:
+        return body, True
+    body = await render()
+    if body is not None:
+        await cache.aset(key, body,
+                         timeout=settings.RECIPE_RESPONSE_CACHE_TIMEOUT)
+    return body, False
+
+
+def _count_recipe_entry(result):
+    """Увеличить счетчик попаданий или промахов кеша рецептов."""
+    key = RECIPE_STATS_KEY.format(result=result)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_recipe_cache_stats():
+    """Счетчики попаданий и промахов кеша ответов по рецептам."""
+    values = cache.get_many([RECIPE_STATS_KEY.format(result=result)
+                             for result in RECIPE_STATS_RESULTS])
+    return {
+        result: values.get(RECIPE_STATS_KEY.format(result=result), 0)
+        for result in RECIPE_STATS_RESULTS
+    }
@@ -1,15 +1,39 @@
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Lower
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingList, Tag,
+                            TagRecipe)
+from recipes.search import search_recipes
 
 
 class RecipeFilter(filters.FilterSet):
-    """Фильтрсет для фильтрации рецептов."""
+    """Фильтрсет для фильтрации рецептов.
 
-    is_favorited = filters.Filter(field_name='is_favorited')
-    is_in_shopping_cart = filters.Filter(field_name='is_in_shopping_cart')
+    Избранное, список покупок и теги фильтруются полусоединениями EXISTS,
+    поэтому рецепты с несколькими тегами не дублируются.
+    """
+
+    is_favorited = filters.BooleanFilter(method='filter_user_relation')
+    is_in_shopping_cart = filters.BooleanFilter(
+        method='filter_user_relation'
+    )
     author = filters.Filter(field_name='author__id')
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.CharFilter(method='filter_tags')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Популярные'), ('trending', 'В трендах')),
+        method='filter_ordering',
+    )
+
+    relation_models = {
+        'is_favorited': Favorite,
+        'is_in_shopping_cart': ShoppingList,
+    }
+    orderings = {
+        'popular': ('-favorites_count', '-pub_date', '-id'),
+        'trending': ('-trending_score', '-pub_date', '-id'),
+    }
 
     class Meta:
         model = Recipe
@@ -18,13 +42,60 @@ class RecipeFilter(filters.FilterSet):
             'is_in_shopping_cart',
             'author',
             'tags',
+            'search',
+            'ordering',
         ]
 
+    def filter_user_relation(self, queryset, name, value):
+        """Оставить рецепты из избранного или списка покупок."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        relation = Exists(self.relation_models[name].objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+        return queryset.filter(relation if value else ~relation)
+
+    def filter_tags(self, queryset, name, value):
+        """Оставить рецепты хотя бы с одним из тегов."""
+        slugs = self.request.query_params.getlist(name)
+        return queryset.filter(Exists(TagRecipe.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=Tag.objects.filter(slug__in=slugs).values('id'),
+        )))
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию, тексту и ингредиентам."""
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Сортировка по счетчику избранного или рейтингу в трендах.
+
+        Оба поля хранятся в рецепте и покрыты индексами, поэтому
+        избранное не агрегируется при каждом запросе. Результаты поиска
+        остаются упорядочены по релевантности, а выбранная сортировка
+        упорядочивает рецепты с равным рангом.
+        """
+        ordering = self.orderings[value]
+        if 'search_rank' in queryset.query.annotations:
+            ordering = ('-search_rank', *ordering)
+        return queryset.order_by(*ordering)
+
 
 class IngredientFilter(filters.FilterSet):
     """Фильтрсет для фильтрации ингредиентов."""
-    name = filters.CharFilter(lookup_expr='istartswith')
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+    def filter_name(self, queryset, name, value):
+        """Поиск по началу названия через индекс по lower(name).
+
+        lower() в SQLite меняет регистр только латиницы, поэтому там
+        кириллица ищется с учетом регистра.
+        """
+        return queryset.annotate(name_lower=Lower('name')).filter(
+            name_lower__startswith=value.lower()
+        )
@@ -0,0 +1,249 @@
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connection
+
+SERVER_MODES = {
+    'wsgi': ('foodgram.wsgi:application',),
+    'asgi': ('foodgram.asgi:application',
+             '--worker-class', 'uvicorn.workers.UvicornWorker'),
+}
+READY_PATH = '/api/tags/'
+READY_TIMEOUT = 30
+
+
+class LoadTarget:
+    """Адрес GET-запроса нагрузочного теста с токеном или без."""
+
+    def __init__(self, label, path, token=None):
+        self.label = label
+        self.path = quote(path, safe='/?=&')
+        self.headers = {'Accept': 'application/json'}
+        if token is not None:
+            self.headers['Authorization'] = f'Token {token}'
+
+
+class Server:
+    """gunicorn в отдельном процессе на тестовой базе.
+
+    Окружение процесса повторяет текущее, кроме имени базы, DEBUG,
+    кеша в памяти процесса, папки метрик и extra_env. Без workers
+    их число берется из gunicorn.conf.py. Вывод сервера пишется
+    в log_path.
+    """
+
+    def __init__(self, mode, workers, log_path, extra_args=(),
+                 extra_env=None):
+        self.mode = mode
+        self.port = free_port()
+        self.args = [
+            sys.executable, '-m', 'gunicorn', *SERVER_MODES[mode],
+            '--bind', f'127.0.0.1:{self.port}',
+            *extra_args,
+        ]
+        if workers is not None:
+            self.args += ['--workers', str(workers)]
+        self.env = dict(
+            os.environ,
+            DB_NAME=str(connection.settings_dict['NAME']),
+            DEBUG='False',
+            ALLOWED_HOSTS='127.0.0.1',
+            METRICS_DIR=str(Path(log_path).with_suffix('.metrics')),
+            **(extra_env or {}),
+        )
+        if mode == 'wsgi':
+            self.env.pop('ASGI_MODE', None)
+        if 'locmem' in self.env.get('CACHE_BACKEND', 'locmem'):
+            # Общий для воркеров кеш без отдельного сервера, иначе
+            # gunicorn.conf.py запустит один воркер.
+            self.env.update(
+                CACHE_BACKEND=('django.core.cache.backends.filebased.'
+                               'FileBasedCache'),
+                CACHE_LOCATION=str(Path(log_path).with_suffix('.cache')),
+            )
+        self.log_path = log_path
+        self.process = None
+        self.startup = None
+
+    def __enter__(self):
+        self.log = open(self.log_path, 'wb')
+        self.process = subprocess.Popen(
+            self.args, cwd=settings.BASE_DIR, env=self.env,
+            stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        start = time.monotonic()
+        try:
+            self._wait_ready()
+        except Exception:
+            self.__exit__()
+            raise
+        self.startup = time.monotonic() - start
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=READY_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+    def memory(self):
+        """Суммарный PSS мастера и воркеров в КиБ, None вне Linux.
+
+        PSS делит общие страницы между процессами, поэтому память,
+        унаследованная воркерами от мастера при preload_app, не
+        считается несколько раз.
+        """
+        proc = Path('/proc')
+        pids = [str(self.process.pid)]
+        total = 0
+        try:
+            for task in (proc / pids[0] / 'task').iterdir():
+                pids += (task / 'children').read_text().split()
+            for pid in pids:
+                rollup = (proc / pid / 'smaps_rollup').read_text()
+                total += sum(int(line.split()[1])
+                             for line in rollup.splitlines()
+                             if line.startswith('Pss:'))
+        except OSError:
+            return None
+        return total
+
+    def _wait_ready(self):
+        """Дождаться первого ответа 200."""
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                client = http.client.HTTPConnection('127.0.0.1', self.port,
+                                                    timeout=1)
+                client.request('GET', READY_PATH)
+                if client.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        with open(self.log_path, errors='replace') as log:
+            tail = log.read()[-2000:]
+        raise RuntimeError(f'{self.mode}: сервер не запустился\n{tail}')
+
+
+def free_port():
+    """Свободный порт на localhost."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LoadRun:
+    """Закрытый цикл: клиенты шлют запросы без пауз.
+
+    Каждый клиент держит keep-alive соединение и перебирает цели
+    по кругу со своего смещения. Ответы первых warmup секунд
+    не учитываются. Медленные клиенты передают заголовки запроса
+    по байту за slow_seconds и в задержки не попадают: они только
+    занимают сервер, как клиенты на плохой сети без буферизующего
+    прокси.
+    """
+
+    def __init__(self, port, targets, duration, warmup):
+        self.port = port
+        self.targets = targets
+        self.duration = duration
+        self.measure_from = time.monotonic() + warmup
+        self.deadline = self.measure_from + duration
+        self.latencies = {target.label: [] for target in targets}
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def run(self, concurrency, slow_clients=0, slow_seconds=5.0):
+        """Выполнить нагрузку и вернуть задержки в секундах по меткам."""
+        threads = [
+            threading.Thread(target=self.client, args=(offset,))
+            for offset in range(concurrency)
+        ] + [
+            threading.Thread(target=self.slow_client, args=(slow_seconds,))
+            for _ in range(slow_clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.latencies
+
+    def client(self, offset):
+        """Быстрый клиент с keep-alive."""
+        client = http.client.HTTPConnection('127.0.0.1', self.port,
+                                            timeout=60)
+        latencies = {target.label: [] for target in self.targets}
+        errors = 0
+        index = offset
+        sent = time.monotonic()
+        while sent < self.deadline:
+            target = self.targets[index % len(self.targets)]
+            index += 1
+            ok = self._request(client, target)
+            received = time.monotonic()
+            if sent >= self.measure_from:
+                if ok:
+                    latencies[target.label].append(received - sent)
+                else:
+                    errors += 1
+            sent = time.monotonic()
+        client.close()
+        with self.lock:
+            for label, values in latencies.items():
+                self.latencies[label].extend(values)
+            self.errors += errors
+
+    def slow_client(self, seconds):
+        """Клиент, который медленно передает заголовки запроса."""
+        target = self.targets[0]
+        request = (
+            f'GET {target.path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+            + ''.join(f'{name}: {value}\r\n'
+                      for name, value in target.headers.items())
+            + 'Connection: close\r\n\r\n'
+        ).encode()
+        pause = seconds / len(request)
+        while time.monotonic() < self.deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', self.port),
+                                              timeout=60) as sock:
+                    for byte in request:
+                        sock.sendall(bytes((byte,)))
+                        time.sleep(pause)
+                    while sock.recv(65536):
+                        pass
+            except OSError:
+                time.sleep(pause)
+
+    @staticmethod
+    def _request(client, target):
+        """Отправить запрос и прочитать ответ, True при статусе 200."""
+        try:
+            client.request('GET', target.path, headers=target.headers)
+            response = client.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            client.close()
+            return False
+        return response.status == 200
+
+
+def percentile(values, share):
+    """Перцентиль отсортированного списка."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * share))]
@@ -0,0 +1,171 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from api.benchmark import (EXCLUDED_ROUTES, BenchmarkData, benchmark_database,
+                           build_scenarios, route_names, run_scenario)
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    """Команда для замера всех маршрутов API
+    Вызов python3 manage.py benchmark_api --baseline benchmarks/baseline.json
+    из терминала в соответствующей папке.
+    Данные создаются в отдельной тестовой базе (временный файл SQLite
+    или test_<имя> в PostgreSQL), которая удаляется после замера.
+    Без базовых результатов для текущей СУБД команда завершается
+    ошибкой, чтобы замер не проходил молча без сравнения.
+    Количество запросов сравнивается с базовым точно, медиана задержки
+    и память - с допуском --threshold. p95 выводится для сведения:
+    на 20 повторах он слишком зависит от планировщика ОС.
+    """
+
+    help = 'Запросы, p50/p95 и память всех маршрутов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя.')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Рецептов в списке покупок на пользователя.')
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.5,
+            help='Допустимый рост p50 и памяти относительно базового.',
+        )
+        parser.add_argument(
+            '--latency-floor',
+            type=float,
+            default=2.0,
+            help='Рост p50 меньше этого числа мс не считается регрессией.',
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Записать результаты как базовые для текущей СУБД.',
+        )
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        if options['users'] < 4 or options['recipes'] < 2:
+            raise CommandError('Нужно минимум 4 пользователя и 2 рецепта.')
+        data = BenchmarkData(
+            options['users'], options['recipes'], options['ingredients'],
+            options['ingredients_per_recipe'], options['tags'],
+            options['favorites'], options['cart'], options['follows'],
+        )
+        results = self._run(data, options)
+        self._compare(data, results, options)
+
+    def _run(self, data, options):
+        """Создать тестовую базу, наполнить ее и пройти все сценарии."""
+        with benchmark_database(options['keepdb']) as temp_dir:
+            with override_settings(
+                MEDIA_ROOT=temp_dir,
+                CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.locmem.'
+                               'LocMemCache',
+                    'LOCATION': 'benchmark',
+                }},
+                PASSWORD_HASHERS=[
+                    'django.contrib.auth.hashers.MD5PasswordHasher',
+                ],
+                # Случайная выборка профилирования меняла бы число рядов
+                # метрик, а с ним память ответа /api/metrics/.
+                PROFILING_SAMPLE_RATE=0,
+            ):
+                return self._run_scenarios(data, options)
+
+    def _run_scenarios(self, data, options):
+        """Наполнить базу и замерить каждый сценарий."""
+        data.seed()
+        scenarios = build_scenarios(data)
+        uncovered = (route_names() - set(EXCLUDED_ROUTES)
+                     - {scenario.route for scenario in scenarios})
+        if uncovered:
+            raise CommandError('Маршруты без сценария: '
+                               + ', '.join(sorted(uncovered)))
+        results = {}
+        for scenario in scenarios:
+            results[scenario.label] = run_scenario(
+                data, scenario, options['repeat'], options['warmup']
+            )
+            self._write_row(scenario.label, results[scenario.label])
+        return results
+
+    def _write_row(self, label, result):
+        """Вывести строку результата сценария."""
+        self.stdout.write(
+            f'{label:55} queries={result["queries"]:<3} '
+            f'p50={result["p50_ms"]:>8.2f} мс '
+            f'p95={result["p95_ms"]:>8.2f} мс '
+            f'alloc={result["alloc_kib"]:>9.1f} КиБ'
+        )
+
+    def _compare(self, data, results, options):
+        """Сравнить с базовыми результатами текущей СУБД."""
+        path = Path(options['baseline'])
+        baseline = json.loads(path.read_text()) if path.exists() else {}
+        vendor = connection.vendor
+        if options['update_baseline']:
+            baseline[vendor] = {'scale': data.scale, 'results': results}
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(baseline, ensure_ascii=False,
+                                       indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовые результаты {vendor} записаны в {path}'
+            ))
+            return
+        if vendor not in baseline:
+            raise CommandError(
+                f'Нет базовых результатов для {vendor} в {path}, '
+                'запишите их с --update-baseline'
+            )
+        if baseline[vendor]['scale'] != data.scale:
+            raise CommandError('Масштаб данных отличается от базового: '
+                               f'{baseline[vendor]["scale"]}')
+        regressions = []
+        factor = 1 + options['threshold']
+        for label, result in results.items():
+            base = baseline[vendor]['results'].get(label)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{label}: запросов {result["queries"]} '
+                    f'вместо {base["queries"]}'
+                )
+            if (result['p50_ms'] > base['p50_ms'] * factor
+                    and result['p50_ms'] - base['p50_ms']
+                    > options['latency_floor']):
+                regressions.append(
+                    f'{label}: p50 {result["p50_ms"]} мс '
+                    f'вместо {base["p50_ms"]} мс'
+                )
+            if result['alloc_kib'] > base['alloc_kib'] * factor:
+                regressions.append(
+                    f'{label}: память {result["alloc_kib"]} КиБ '
+                    f'вместо {base["alloc_kib"]} КиБ'
+                )
+        if regressions:
+            raise CommandError('Регрессии относительно базовых '
+                               'результатов:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            f'Регрессий относительно {path} нет'
+        ))
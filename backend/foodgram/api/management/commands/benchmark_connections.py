@@ -0,0 +1,129 @@
+import statistics
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from recipes.models import Ingredient, Tag
+
+
+class Command(BaseCommand):
+    """Команда для замера затрат на соединение с базой
+    Вызов python3 manage.py benchmark_connections --requests 200
+    из терминала в соответствующей папке.
+    Запросы идут через WSGIHandler, как в gunicorn: сигналы начала
+    и конца запроса закрывают соединение по CONN_MAX_AGE, чего не
+    делает тестовый клиент. Сравниваются новое соединение на каждый
+    запрос, постоянное соединение и постоянное с проверкой
+    CONN_HEALTH_CHECKS. Для PgBouncer укажите его в DB_HOST/DB_PORT
+    и DB_PGBOUNCER=True.
+    """
+
+    help = 'Задержка дешевых запросов с постоянными соединениями и без'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--max-age', type=int, default=60)
+        parser.add_argument(
+            '--path',
+            action='append',
+            help='Адрес GET-запроса, по умолчанию тег и ингредиент.',
+        )
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        paths = options['path'] or self._default_paths()
+        settings_dict = connection.settings_dict
+        saved = {key: settings_dict[key]
+                 for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        cursors = ('отключены' if settings_dict['DISABLE_SERVER_SIDE_CURSORS']
+                   else 'включены')
+        self.stdout.write(
+            f'{connection.vendor} {settings_dict["HOST"] or "local"}:'
+            f'{settings_dict["PORT"] or "-"}, серверные курсоры {cursors}'
+        )
+        self._report('Установка соединения', self._connect_timings(
+            options['requests']
+        ))
+        modes = (
+            ('Новое соединение на запрос', 0, False),
+            ('CONN_MAX_AGE', options['max_age'], False),
+            ('CONN_MAX_AGE + CONN_HEALTH_CHECKS', options['max_age'], True),
+        )
+        handler = WSGIHandler()
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                for label, max_age, health_checks in modes:
+                    connection.close()
+                    settings_dict.update(CONN_MAX_AGE=max_age,
+                                         CONN_HEALTH_CHECKS=health_checks)
+                    self.stdout.write(f'\n{label}')
+                    for path in paths:
+                        opened, timings = self._run(handler, path,
+                                                    options['requests'])
+                        self._report(f'  {path} (соединений: {opened})',
+                                     timings)
+        finally:
+            connection.close()
+            settings_dict.update(saved)
+
+    def _default_paths(self):
+        """Дешевые запросы к одной строке справочника."""
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if tag is None or ingredient is None:
+            raise CommandError('Нужны теги и ингредиенты в базе, '
+                               'выполните import_data или укажите --path.')
+        return [f'/api/tags/{tag.pk}/', f'/api/ingredients/{ingredient.pk}/']
+
+    def _connect_timings(self, repeat):
+        """Время установки соединения без запроса."""
+        connection.close()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            connection.connect()
+            timings.append(time.perf_counter() - start)
+            connection.close()
+        return timings
+
+    def _run(self, handler, path, repeat):
+        """Выполнить запросы через WSGI и посчитать новые соединения."""
+        opened = []
+
+        def count(sender, **kwargs):
+            opened.append(kwargs['connection'].alias)
+
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(status)
+
+        timings = []
+        connection_created.connect(count)
+        try:
+            for _ in range(repeat):
+                environ = {'PATH_INFO': path,
+                           'HTTP_ACCEPT': 'application/json'}
+                setup_testing_defaults(environ)
+                start = time.perf_counter()
+                response = handler(environ, start_response)
+                b''.join(response)
+                response.close()
+                timings.append(time.perf_counter() - start)
+        finally:
+            connection_created.disconnect(count)
+        if statuses[-1] != '200 OK':
+            raise CommandError(f'{path}: {statuses[-1]}')
+        return len(opened), timings
+
+    def _report(self, label, timings):
+        """Вывести медиану и p95 в миллисекундах."""
+        timings = sorted(timing * 1000 for timing in timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(f'{label}: p50 {statistics.median(timings):.2f} '
+                          f'мс, p95 {p95:.2f} мс')
@@ -0,0 +1,88 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+from users.models import User
+
+BATCH_SIZE = 10000
+INGREDIENTS_PER_RECIPE = 8
+PANTRY_SIZES = (3, 10, 30)
+
+
+class Command(BaseCommand):
+    """Команда для замера подбора рецептов по ингредиентам
+    Вызов python3 manage.py benchmark_coverage --recipes 100000
+    из терминала в соответствующей папке.
+    Синтетические данные создаются в транзакции и откатываются.
+    """
+
+    help = 'Планы и время подбора рецептов по покрытию ингредиентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        self.repeat = options['repeat']
+        self.random = random.Random(0)
+        with transaction.atomic():
+            ingredients = self._seed(options['recipes'],
+                                     options['ingredients'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            for size in PANTRY_SIZES:
+                self._report(self.random.sample(ingredients, size))
+            transaction.set_rollback(True)
+
+    def _seed(self, recipes_count, ingredients_count):
+        """Создать рецепты с ингредиентами для замера."""
+        author = User.objects.create(username='benchmark-coverage',
+                                     email='benchmark-coverage@example.com')
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'benchmark-{index}', measurement_unit='г')
+             for index in range(ingredients_count)),
+            batch_size=BATCH_SIZE,
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='benchmark-'
+        ).values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            (Recipe(name=f'benchmark-{index}', author=author,
+                    text='', cooking_time=1)
+             for index in range(recipes_count)),
+            batch_size=BATCH_SIZE,
+        )
+        recipes = Recipe.objects.filter(
+            name__startswith='benchmark-'
+        ).values_list('id', flat=True)
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe_id=recipe, ingredient_id=ingredient,
+                              amount=1)
+             for recipe in recipes.iterator()
+             for ingredient in self.random.sample(ingredients,
+                                                  INGREDIENTS_PER_RECIPE)),
+            batch_size=BATCH_SIZE,
+        )
+        return ingredients
+
+    def _report(self, pantry):
+        """Вывести план и медианное время подбора для набора."""
+        queryset = Recipe.objects.by_ingredient_coverage(pantry).values(
+            'id', 'ingredients_matched', 'ingredients_missing'
+        )[:6]
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f'Ингредиентов в наборе {len(pantry)}: '
+            f'{statistics.median(timings):.2f} мс\n'
+            f'{queryset.explain()}'
+        )
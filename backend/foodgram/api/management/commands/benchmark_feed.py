@@ -0,0 +1,184 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from recipes.models import Follow, Recipe
+from users.models import User
+
+BATCH_SIZE = 10000
+PAGE_SIZE = 6
+INBOX_TABLE = 'benchmark_feed_inbox'
+
+
+class Command(BaseCommand):
+    """Команда для сравнения ленты подписок тремя способами
+    Вызов python3 manage.py benchmark_feed --authors 1000
+    из терминала в соответствующей папке.
+    Сравнивает слияние срезов по индексам авторов (используется
+    в /api/recipes/feed/), обход индекса даты с проверкой подписки
+    и таблицу-ящик, заполняемую при записи, и выводит план запроса
+    ленты. С --followed-authors читатели подписаны только на часть
+    авторов.
+    Синтетические данные создаются в транзакции и откатываются.
+    """
+
+    help = 'Сравнение ленты подписок: слияние по авторам, обход и ящик'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--recipes-per-author', type=int, default=20)
+        parser.add_argument('--followers', type=int, default=10)
+        parser.add_argument(
+            '--followed-authors',
+            type=int,
+            help='На скольких авторов подписан читатель, по умолчанию '
+                 'на всех.',
+        )
+        parser.add_argument('--pages', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        self.repeat = options['repeat']
+        self.pages = options['pages']
+        with transaction.atomic():
+            followers = self._seed(options['authors'],
+                                   options['recipes_per_author'],
+                                   options['followers'],
+                                   options['followed_authors'])
+            self._build_inbox()
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            reader = followers[0]
+            page = self._feed_queryset(reader)
+            if page.query.is_empty():
+                self.stdout.write('Читатель ни на кого не подписан.')
+            else:
+                self.stdout.write('План ленты:\n' + page.explain())
+            self._report('Слияние срезов по индексам авторов',
+                         lambda cursor: self._merge_page(reader, cursor))
+            self._report('Обход индекса даты с проверкой подписки',
+                         lambda cursor: self._walk_page(reader, cursor))
+            self._report('Ящик, заполненный при записи',
+                         lambda cursor: self._inbox_page(reader, cursor))
+            transaction.set_rollback(True)
+
+    def _seed(self, authors_count, recipes_count, followers_count,
+              followed_count):
+        """Создать авторов с рецептами и подписчиков на первых авторов."""
+        User.objects.bulk_create(
+            (User(username=f'benchmark-{index}',
+                  email=f'benchmark-{index}@example.com')
+             for index in range(authors_count + followers_count)),
+            batch_size=BATCH_SIZE,
+        )
+        users = list(User.objects.filter(
+            username__startswith='benchmark-'
+        ).values_list('id', flat=True))
+        authors, followers = users[:authors_count], users[authors_count:]
+        now = timezone.now()
+        recipes = [
+            Recipe(name=f'benchmark-{index}', text='', cooking_time=1,
+                   author_id=authors[index % len(authors)])
+            for index in range(authors_count * recipes_count)
+        ]
+        Recipe.objects.bulk_create(recipes, batch_size=BATCH_SIZE)
+        for index, recipe in enumerate(recipes):
+            recipe.pub_date = now - timedelta(minutes=index)
+        Recipe.objects.bulk_update(recipes, ('pub_date',),
+                                   batch_size=1000)
+        Follow.objects.bulk_create(
+            (Follow(user_id=follower, following_id=author)
+             for follower in followers
+             for author in authors[:followed_count]),
+            batch_size=BATCH_SIZE,
+        )
+        self.stdout.write(
+            f'Авторов: {len(authors)}, рецептов: {len(recipes)}, '
+            f'подписчиков: {len(followers)}'
+        )
+        return followers
+
+    def _build_inbox(self):
+        """Заполнить ящик: строка на каждую пару подписчик-рецепт."""
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {INBOX_TABLE} ('
+                'user_id integer NOT NULL, recipe_id integer NOT NULL, '
+                'pub_date timestamp NOT NULL)'
+            )
+            cursor.execute(
+                f'INSERT INTO {INBOX_TABLE} (user_id, recipe_id, pub_date) '
+                f'SELECT f.user_id, r.id, r.pub_date '
+                f'FROM {Follow._meta.db_table} f '
+                f'JOIN {Recipe._meta.db_table} r '
+                'ON r.author_id = f.following_id'
+            )
+            rows = cursor.rowcount
+            cursor.execute(
+                f'CREATE INDEX {INBOX_TABLE}_idx ON {INBOX_TABLE} '
+                '(user_id, pub_date DESC, recipe_id DESC)'
+            )
+        self.stdout.write(
+            f'Ящик: {rows} строк за {time.perf_counter() - start:.2f} с'
+        )
+
+    def _feed_queryset(self, reader, cursor=None):
+        """Страница ленты слиянием срезов по авторам."""
+        return self._page(Recipe.objects.feed(reader), cursor)
+
+    def _page(self, queryset, cursor):
+        """Срез страницы после курсора."""
+        queryset = queryset.order_by('-pub_date', '-id')
+        if cursor:
+            queryset = queryset.filter(pub_date__lt=cursor)
+        return queryset.values_list('id', 'pub_date')[:PAGE_SIZE]
+
+    def _merge_page(self, reader, cursor):
+        """Страница ленты из рецептов."""
+        return list(self._feed_queryset(reader, cursor))
+
+    def _walk_page(self, reader, cursor):
+        """Страница ленты обходом индекса даты с EXISTS по подпискам."""
+        return list(self._page(Recipe.objects.filter(Exists(
+            Follow.objects.filter(user=reader, following=OuterRef('author'))
+        )), cursor))
+
+    def _inbox_page(self, reader, cursor):
+        """Страница ленты из ящика с догрузкой рецептов по id."""
+        sql = (f'SELECT recipe_id, pub_date FROM {INBOX_TABLE} '
+               'WHERE user_id = %s')
+        params = [reader]
+        if cursor:
+            sql += ' AND pub_date < %s'
+            params.append(cursor)
+        sql += ' ORDER BY pub_date DESC, recipe_id DESC LIMIT %s'
+        params.append(PAGE_SIZE)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            rows = db_cursor.fetchall()
+        recipes = Recipe.objects.in_bulk([row[0] for row in rows])
+        return [(recipes[row[0]].id, recipes[row[0]].pub_date)
+                for row in rows]
+
+    def _report(self, title, fetch_page):
+        """Вывести медианное время первых страниц ленты."""
+        timings = []
+        for _ in range(self.repeat):
+            cursor = None
+            start = time.perf_counter()
+            for pages in range(1, self.pages + 1):
+                page = fetch_page(cursor)
+                if not page:
+                    break
+                cursor = page[-1][1]
+            timings.append((time.perf_counter() - start) * 1000 / pages)
+        self.stdout.write(
+            f'{title}: {statistics.median(timings):.2f} мс на страницу'
+        )
@@ -0,0 +1,117 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.filters import RecipeFilter
+from recipes.models import Favorite, Recipe, Tag, TagRecipe
+from users.models import User
+
+BATCH_SIZE = 10000
+FILTERS = {
+    'is_favorited': {'is_favorited': '1'},
+    'tags': {'tags': ['benchmark-0', 'benchmark-1']},
+}
+
+
+class Command(BaseCommand):
+    """Команда для проверки планов запросов фильтров рецептов
+    Вызов python3 manage.py benchmark_filters --sizes 10000,1000000
+    из терминала в соответствующей папке.
+    Синтетические данные создаются в транзакции и откатываются.
+    """
+
+    help = 'Планы и время фильтров рецептов при росте избранного'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10000,100000,1000000',
+            help='Количества записей избранного через запятую.',
+        )
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        if sizes[-1] > options['users'] * options['recipes']:
+            raise CommandError('Избранного больше, чем пар '
+                               'пользователь-рецепт.')
+        self.repeat = options['repeat']
+        with transaction.atomic():
+            users, recipes = self._seed(options['users'], options['recipes'])
+            created = 0
+            for size in sizes:
+                Favorite.objects.bulk_create(
+                    (Favorite(user_id=users[index // len(recipes)],
+                              recipe_id=recipes[index % len(recipes)])
+                     for index in range(created, size)),
+                    batch_size=BATCH_SIZE,
+                )
+                created = size
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                self._report(size, User.objects.get(pk=users[0]))
+            transaction.set_rollback(True)
+
+    def _seed(self, users_count, recipes_count):
+        """Создать пользователей, рецепты и теги для замера."""
+        User.objects.bulk_create(
+            User(username=f'benchmark-{index}',
+                 email=f'benchmark-{index}@example.com')
+            for index in range(users_count)
+        )
+        users = list(User.objects.filter(
+            username__startswith='benchmark-'
+        ).values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            (Recipe(name=f'benchmark-{index}', author_id=users[0],
+                    text='', cooking_time=1)
+             for index in range(recipes_count)),
+            batch_size=BATCH_SIZE,
+        )
+        recipes = list(Recipe.objects.filter(
+            name__startswith='benchmark-'
+        ).values_list('id', flat=True))
+        Tag.objects.bulk_create(
+            Tag(name=f'benchmark-{index}', slug=f'benchmark-{index}',
+                color=f'#00000{index}')
+            for index in range(3)
+        )
+        tags = list(Tag.objects.filter(
+            slug__startswith='benchmark-'
+        ).values_list('id', flat=True))
+        TagRecipe.objects.bulk_create(
+            (TagRecipe(recipe_id=recipe, tag_id=tags[index % len(tags)])
+             for index, recipe in enumerate(recipes)),
+            batch_size=BATCH_SIZE,
+        )
+        return users, recipes
+
+    def _report(self, size, user):
+        """Вывести план и медианное время каждого фильтра."""
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Избранного: {size}'
+        ))
+        for name, params in FILTERS.items():
+            request = Request(RequestFactory().get('/', params))
+            request.user = user
+            queryset = RecipeFilter(
+                request.query_params,
+                queryset=Recipe.objects.with_user_flags(user),
+                request=request,
+            ).qs[:6]
+            timings = []
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                list(queryset.values_list('id', flat=True))
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(
+                f'{name}: {statistics.median(timings):.2f} мс\n'
+                f'{queryset.explain()}'
+            )
@@ -0,0 +1,104 @@
+import itertools
+import multiprocessing
+from pathlib import Path
+
+from django.core.management.base import CommandError
+
+from api.benchmark import benchmark_database
+from api.loadtest import Server
+from api.management.commands.benchmark_servers import Command as ServersCommand
+
+WORKER_CLASSES = {
+    'sync': 'gunicorn',
+    'gthread': 'gunicorn',
+    'gevent': 'gevent',
+    'uvicorn': 'uvicorn',
+}
+
+
+class Command(ServersCommand):
+    """Команда подбора настроек gunicorn.conf.py
+    Вызов python3 manage.py benchmark_gunicorn --workers 3 5 --threads 1 4
+    из терминала в соответствующей папке.
+    Перебирает классы воркеров, число воркеров и потоков и preload_app,
+    запуская gunicorn с gunicorn.conf.py и переменными GUNICORN_*,
+    как в контейнере. Для каждого набора выводит пропускную способность,
+    хвост задержки, время запуска и память процессов. С --slow-clients
+    видно, сколько медленных клиентов выдерживает каждый набор.
+    """
+
+    help = 'Пропускная способность и задержка наборов настроек gunicorn'
+
+    def add_arguments(self, parser):
+        cpu_count = multiprocessing.cpu_count()
+        parser.add_argument('--worker-classes', nargs='+',
+                            choices=WORKER_CLASSES,
+                            default=['sync', 'gthread'])
+        parser.add_argument('--workers', type=int, nargs='+',
+                            default=[cpu_count + 1, cpu_count * 2 + 1])
+        parser.add_argument(
+            '--threads',
+            type=int,
+            nargs='+',
+            default=[4, 8],
+            help='Только для gthread, остальные классы работают без потоков.',
+        )
+        parser.add_argument('--preload', nargs='+', choices=('True', 'False'),
+                            default=['True'])
+        self._add_load_arguments(parser)
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        self._check_modules(*{WORKER_CLASSES[worker_class]
+                              for worker_class in options['worker_classes']})
+        data = self._benchmark_data(options)
+        summary = {}
+        with benchmark_database(options['keepdb']) as temp_dir:
+            data.seed()
+            targets = self._targets(data)
+            for label, env in self._configs(options):
+                mode = ('asgi' if env['GUNICORN_WORKER_CLASS'] == 'uvicorn'
+                        else 'wsgi')
+                log_path = Path(temp_dir) / f'{len(summary)}.log'
+                try:
+                    with Server(mode, None, log_path,
+                                extra_env=env) as server:
+                        load = self._run_load(server, targets, options)
+                        memory = server.memory()
+                except RuntimeError as error:
+                    raise CommandError(str(error))
+                rps, p99 = self._report(label, load)
+                summary[label] = rps, p99, server.startup, memory
+        self._rank(summary)
+
+    def _configs(self, options):
+        """Наборы переменных GUNICORN_* с подписями."""
+        for worker_class, workers, preload in itertools.product(
+            options['worker_classes'], options['workers'], options['preload']
+        ):
+            threads_options = (options['threads'] if worker_class == 'gthread'
+                               else [1])
+            for threads in threads_options:
+                label = f'{worker_class} workers={workers}'
+                if worker_class == 'gthread':
+                    label += f' threads={threads}'
+                if len(options['preload']) > 1:
+                    label += f' preload={preload}'
+                yield label, {
+                    'GUNICORN_WORKER_CLASS': worker_class,
+                    'GUNICORN_WORKERS': str(workers),
+                    'GUNICORN_THREADS': str(threads),
+                    'GUNICORN_PRELOAD': preload,
+                }
+
+    def _rank(self, summary):
+        """Наборы по убыванию пропускной способности."""
+        self.stdout.write('\nИтог:')
+        ranked = sorted(summary.items(), key=lambda item: -item[1][0])
+        for label, (rps, p99, startup, memory) in ranked:
+            memory = f'{memory / 1024:.0f} МиБ' if memory else '-'
+            self.stdout.write(
+                f'  {label:40} {rps:8.1f} запросов/с '
+                f'p99 {p99 * 1000:8.1f} мс, запуск {startup:.1f} с, '
+                f'память {memory}'
+            )
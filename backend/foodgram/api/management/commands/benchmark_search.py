@@ -0,0 +1,88 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+from recipes.search import search_recipes, update_search_vectors
+from users.models import User
+
+BATCH_SIZE = 10000
+WORDS = ('борщ', 'салат', 'суп', 'пирог', 'каша', 'омлет', 'рагу', 'плов')
+QUERIES = ('борщ', 'салат с курицей', 'пирог -каша')
+
+
+class Command(BaseCommand):
+    """Команда для замера поиска рецептов по тексту
+    Вызов python3 manage.py benchmark_search --recipes 100000
+    из терминала в соответствующей папке.
+    Синтетические данные создаются в транзакции и откатываются.
+    """
+
+    help = 'Планы и время полнотекстового поиска рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        self.repeat = options['repeat']
+        with transaction.atomic():
+            self._seed(options['recipes'])
+            start = time.perf_counter()
+            update_search_vectors(
+                Recipe.objects.filter(name__startswith='benchmark-')
+            )
+            self.stdout.write(
+                f'Построение векторов: {time.perf_counter() - start:.2f} с'
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            for text in QUERIES:
+                self._report(text)
+            transaction.set_rollback(True)
+
+    def _seed(self, recipes_count):
+        """Создать рецепты с ингредиентами для замера."""
+        author = User.objects.create(username='benchmark-search',
+                                     email='benchmark-search@example.com')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'benchmark-{word}', measurement_unit='г')
+            for word in ('курица', 'картофель', 'свекла', 'яйцо')
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='benchmark-'
+        ).values_list('id', flat=True))
+        Recipe.objects.bulk_create(
+            (Recipe(name=f'benchmark-{index} {WORDS[index % len(WORDS)]}',
+                    author=author, cooking_time=1,
+                    text=' '.join(WORDS[(index + shift) % len(WORDS)]
+                                  for shift in range(1, 4)))
+             for index in range(recipes_count)),
+            batch_size=BATCH_SIZE,
+        )
+        recipes = Recipe.objects.filter(
+            name__startswith='benchmark-'
+        ).values_list('id', flat=True)
+        IngredientRecipe.objects.bulk_create(
+            (IngredientRecipe(recipe_id=recipe, amount=1,
+                              ingredient_id=ingredients[
+                                  index % len(ingredients)])
+             for index, recipe in enumerate(recipes.iterator())),
+            batch_size=BATCH_SIZE,
+        )
+
+    def _report(self, text):
+        """Вывести план и медианное время поискового запроса."""
+        queryset = search_recipes(Recipe.objects.all(), text)[:6]
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            list(queryset.values_list('id', flat=True))
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f'{text}: {statistics.median(timings):.2f} мс\n'
+            f'{queryset.explain()}'
+        )
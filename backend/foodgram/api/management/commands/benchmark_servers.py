@@ -0,0 +1,137 @@
+import importlib.util
+import statistics
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.benchmark import BenchmarkData, benchmark_database
+from api.loadtest import SERVER_MODES, LoadRun, LoadTarget, Server, percentile
+
+
+class Command(BaseCommand):
+    """Команда нагрузочного теста WSGI и ASGI
+    Вызов python3 manage.py benchmark_servers --concurrency 32
+    из терминала в соответствующей папке.
+    Наполняет тестовую базу, по очереди запускает gunicorn с воркерами
+    из gunicorn.conf.py (foodgram.wsgi) и с воркерами uvicorn
+    (foodgram.asgi) и нагружает рецепты, справочники и скачивание
+    списка покупок.
+    Клиенты работают потоками в этом процессе, поэтому на одной машине
+    с сервером они делят с ним процессор.
+    """
+
+    help = 'Пропускная способность и хвост задержки WSGI и ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=SERVER_MODES,
+                            default=list(SERVER_MODES))
+        parser.add_argument('--workers', type=int, default=2)
+        self._add_load_arguments(parser)
+
+    def _add_load_arguments(self, parser):
+        """Параметры нагрузки и тестовых данных."""
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=15)
+        parser.add_argument('--warmup', type=float, default=3)
+        parser.add_argument(
+            '--slow-clients',
+            type=int,
+            default=0,
+            help='Клиентов, передающих заголовки по байту.',
+        )
+        parser.add_argument('--slow-seconds', type=float, default=5)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=300)
+        parser.add_argument('--cart', type=int, default=20,
+                            help='Рецептов в списке покупок читателя.')
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        self._check_modules('gunicorn', 'uvicorn')
+        data = self._benchmark_data(options)
+        summary = {}
+        with benchmark_database(options['keepdb']) as temp_dir:
+            data.seed()
+            targets = self._targets(data)
+            for mode in options['modes']:
+                log_path = Path(temp_dir) / f'{mode}.log'
+                try:
+                    with Server(mode, options['workers'], log_path) as server:
+                        load = self._run_load(server, targets, options)
+                except RuntimeError as error:
+                    raise CommandError(str(error))
+                summary[mode] = self._report(mode, load)
+        if len(summary) > 1:
+            self._compare(summary)
+
+    def _check_modules(self, *modules):
+        """Убедиться, что серверы установлены."""
+        for module in modules:
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'Не установлен {module}.')
+
+    def _benchmark_data(self, options):
+        """Тестовые данные по параметрам команды."""
+        return BenchmarkData(
+            options['users'], options['recipes'], options['ingredients'],
+            8, 6, 10, options['cart'], 10,
+        )
+
+    def _run_load(self, server, targets, options):
+        """Нагрузить запущенный сервер."""
+        load = LoadRun(server.port, targets, options['duration'],
+                       options['warmup'])
+        load.run(options['concurrency'], options['slow_clients'],
+                 options['slow_seconds'])
+        return load
+
+    def _targets(self, data):
+        """Горячие запросы на чтение от анонима и читателя."""
+        token = Token.objects.create(user=data.reader).key
+        return [
+            LoadTarget('recipes anon', '/api/recipes/?limit=6'),
+            LoadTarget('recipes reader', '/api/recipes/?limit=6', token),
+            LoadTarget('recipe reader', f'/api/recipes/{data.recipe.pk}/',
+                       token),
+            LoadTarget('tags', '/api/tags/'),
+            LoadTarget('ingredients', '/api/ingredients/?name=Ингредиент 1'),
+            LoadTarget('cart download', '/api/recipes/download_shopping_cart/',
+                       token),
+        ]
+
+    def _report(self, mode, load):
+        """Вывести пропускную способность и задержки по целям."""
+        latencies, errors, duration = (load.latencies, load.errors,
+                                       load.duration)
+        total = sum(len(values) for values in latencies.values())
+        everything = sorted(value for values in latencies.values()
+                            for value in values)
+        self.stdout.write(
+            f'\n{mode}: {total / duration:.1f} запросов/с, '
+            f'ошибок {errors}, p99 {percentile(everything, 0.99) * 1000:.1f}'
+            ' мс'
+        )
+        for label, values in latencies.items():
+            values.sort()
+            median = statistics.median(values) if values else 0.0
+            self.stdout.write(
+                f'  {label:15} n={len(values):<6} '
+                f'p50={median * 1000:8.2f} мс '
+                f'p95={percentile(values, 0.95) * 1000:8.2f} мс '
+                f'p99={percentile(values, 0.99) * 1000:8.2f} мс'
+            )
+        return total / duration, percentile(everything, 0.99)
+
+    def _compare(self, summary):
+        """Отношение к первому режиму."""
+        modes = list(summary)
+        base_rps, base_p99 = summary[modes[0]]
+        for mode in modes[1:]:
+            rps, p99 = summary[mode]
+            self.stdout.write(
+                f'\n{mode} / {modes[0]}: запросов/с x{rps / base_rps:.2f}, '
+                f'p99 x{p99 / base_p99:.2f}'
+            )
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk import DEFAULT_BATCH_SIZE, RecipeBulkCreator
+from recipes.management.commands.import_data import iter_records
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Команда для пакетного создания рецептов в формате API
+    Вызов python3 manage.py bulk_create_recipes recipes.ndjson --author email
+    из терминала в соответствующей папке.
+    Рецепты проверяются так же, как в POST /api/recipes/bulk/.
+    """
+
+    help = 'Пакетное создание рецептов из JSON-массива или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл рецептов (.json или .ndjson).')
+        parser.add_argument(
+            '--author',
+            required=True,
+            help='Email автора рецептов.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество рецептов в одной пачке.',
+        )
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть положительным.')
+        author = User.objects.filter(email=options['author']).first()
+        if author is None:
+            raise CommandError(f'Автор {options["author"]} не найден.')
+        report = RecipeBulkCreator(
+            author, batch_size=options['batch_size']
+        ).run(iter_records(options['path']))
+        for result in report['results']:
+            if 'errors' in result:
+                self.stderr.write(
+                    f'Рецепт {result["index"]}: {result["errors"]}'
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано рецептов: {report["created"]}, '
+            f'ошибок: {report["failed"]}, '
+            f'{report["elapsed"]} с ({report["per_second"]} рецептов/с)'
+        ))
@@ -0,0 +1,279 @@
+import bisect
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from api.cache import get_recipe_cache_stats
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+LABELS = ('view', 'method')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+FLUSH_INTERVAL = 1.0
+AGGREGATE_FILE = 'aggregate.json'
+LOCK_FILE = 'metrics.lock'
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с метками view и method."""
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        """Учесть одно значение."""
+        start_flusher()
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [
+                    [0] * (len(self.buckets) + 1), 0, 0.0
+                ]
+            series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def dump(self):
+        """Ряды процесса списком, пригодным для JSON."""
+        with self.lock:
+            return [[labels, [list(counts), count, total]]
+                    for labels, (counts, count, total)
+                    in self.series.items()]
+
+    def merge(self, series, rows):
+        """Прибавить ряды dump() к словарю series."""
+        for labels, (counts, count, total) in rows:
+            merged = series.setdefault(tuple(labels), [
+                [0] * (len(self.buckets) + 1), 0, 0.0
+            ])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += count
+            merged[2] += total
+
+    def expose(self, series):
+        """Строки текстового формата Prometheus."""
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, count, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                yield (f'{self.name}_bucket'
+                       f'{format_labels(labels, le=bound)} {cumulative}')
+            yield f'{self.name}_count{format_labels(labels)} {count}'
+            yield f'{self.name}_sum{format_labels(labels)} {total}'
+
+
+class Counter:
+    """Счетчик в формате Prometheus с метками view и method."""
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        """Увеличить счетчик."""
+        start_flusher()
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + value
+
+    def dump(self):
+        """Ряды процесса списком, пригодным для JSON."""
+        with self.lock:
+            return [[labels, value] for labels, value in self.series.items()]
+
+    def merge(self, series, rows):
+        """Прибавить ряды dump() к словарю series."""
+        for labels, value in rows:
+            series[tuple(labels)] = series.get(tuple(labels), 0) + value
+
+    def expose(self, series):
+        """Строки текстового формата Prometheus."""
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(series.items()):
+            yield f'{self.name}{format_labels(labels)} {value}'
+
+
+def format_labels(labels, **extra):
+    """Метки в фигурных скобках с экранированием значений."""
+    pairs = list(zip(LABELS, labels)) + list(extra.items())
+    return '{' + ','.join(
+        '{0}="{1}"'.format(name, str(value).replace('\\', '\\\\')
+                           .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ) + '}'
+
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки выбранных запросов.',
+    DURATION_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'foodgram_db_duration_seconds',
+    'Время запросов к базе за один запрос API.',
+    DURATION_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries',
+    'Число запросов к базе за один запрос API.',
+    QUERY_BUCKETS,
+)
+REPEATED_QUERIES = Counter(
+    'foodgram_repeated_queries_total',
+    'Запросы API с повторяющимся SQL (признак N+1).',
+)
+METRICS = (REQUEST_DURATION, DB_DURATION, DB_QUERIES, REPEATED_QUERIES)
+
+# Файл метрик процесса в METRICS_DIR. Имя включает uuid: pid нового
+# воркера может совпасть с pid завершенного, чей файл нужно сохранить.
+_process = {'pid': None, 'path': None}
+_process_lock = threading.Lock()
+
+
+def start_flusher():
+    """Запустить поток, раз в FLUSH_INTERVAL пишущий метрики в файл.
+
+    Поток создается в каждом процессе при первом значении: после fork
+    воркеру gunicorn поток мастера не достается.
+    """
+    if not settings.METRICS_DIR or _process['pid'] == os.getpid():
+        return
+    with _process_lock:
+        if _process['pid'] == os.getpid():
+            return
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        _process['path'] = os.path.join(
+            settings.METRICS_DIR, f'{os.getpid()}-{uuid.uuid4().hex}.json'
+        )
+        _process['pid'] = os.getpid()
+        threading.Thread(target=_flush_forever, daemon=True).start()
+
+
+def _flush_forever():
+    """Тело потока записи метрик."""
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush_metrics()
+
+
+def flush_metrics():
+    """Записать метрики процесса в его файл целиком."""
+    if _process['pid'] != os.getpid():
+        return
+    _write_rows(_process['path'],
+                {metric.name: metric.dump() for metric in METRICS})
+
+
+def _write_rows(path, rows):
+    """Заменить файл метрик атомарно."""
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(rows, file)
+    os.replace(f'{path}.tmp', path)
+
+
+def _read_rows(path):
+    """Ряды из файла метрик, пустые при ошибке чтения."""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextmanager
+def _locked(directory, operation):
+    """Блокировка папки метрик на время чтения или слияния файлов."""
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _merge_files(series, paths):
+    """Прибавить к series ряды файлов."""
+    for path in paths:
+        rows = _read_rows(path)
+        for metric in METRICS:
+            metric.merge(series[metric.name], rows.get(metric.name, ()))
+
+
+def fold_worker_metrics(directory, pid):
+    """Перенести метрики завершенного воркера в общий файл.
+
+    Вызывается мастером gunicorn в child_exit: файлы воркеров,
+    перезапускаемых по max_requests, не копятся, а суммы счетчиков
+    не убывают. Читатели ждут блокировку и не видят воркер дважды
+    или ни разу.
+    """
+    paths = glob.glob(os.path.join(directory, f'{pid}-*.json'))
+    if not paths:
+        return
+    aggregate = os.path.join(directory, AGGREGATE_FILE)
+    with _locked(directory, fcntl.LOCK_EX):
+        series = {metric.name: {} for metric in METRICS}
+        _merge_files(series, [aggregate, *paths])
+        _write_rows(aggregate, {
+            name: [[list(labels), value] for labels, value in rows.items()]
+            for name, rows in series.items()
+        })
+        for path in paths:
+            os.remove(path)
+
+
+def collect_series():
+    """Ряды метрик, сложенные по всем процессам.
+
+    Другие процессы и завершенные воркеры читаются из файлов
+    METRICS_DIR, текущий процесс - из памяти, так как его файл
+    отстает на FLUSH_INTERVAL.
+    """
+    series = {metric.name: {} for metric in METRICS}
+    directory = settings.METRICS_DIR
+    if directory and os.path.isdir(directory):
+        own_path = (_process['path'] if _process['pid'] == os.getpid()
+                    else None)
+        with _locked(directory, fcntl.LOCK_SH):
+            _merge_files(series, [
+                path for path in glob.glob(os.path.join(directory, '*.json'))
+                if path != own_path
+            ])
+    for metric in METRICS:
+        metric.merge(series[metric.name], metric.dump())
+    return series
+
+
+def render_metrics():
+    """Метрики всех воркеров и счетчики кеша рецептов текстом Prometheus."""
+    lines = []
+    series = collect_series()
+    for metric in METRICS:
+        lines.extend(metric.expose(series[metric.name]))
+    lines.extend((
+        '# HELP foodgram_profiling_sample_rate Доля профилируемых запросов.',
+        '# TYPE foodgram_profiling_sample_rate gauge',
+        f'foodgram_profiling_sample_rate {settings.PROFILING_SAMPLE_RATE}',
+        '# HELP foodgram_recipe_cache_total Обращения к кешу рецептов.',
+        '# TYPE foodgram_recipe_cache_total counter',
+    ))
+    for result, value in get_recipe_cache_stats().items():
+        lines.append(f'foodgram_recipe_cache_total{{result="{result}"}} '
+                     f'{value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,163 @@
+import json
+import logging
+import random
+import time
+from collections import Counter
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connection
+
+from api.metrics import (DB_DURATION, DB_QUERIES, REPEATED_QUERIES,
+                         REQUEST_DURATION)
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfiler:
+    """Обертка execute_wrapper: число, время и повторы SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        """SQL, выполненный не меньше threshold раз за запрос."""
+        return [(sql, count) for sql, count in self.statements.most_common()
+                if count >= threshold]
+
+
+def install_profiler(profiler):
+    """Поставить обертку соединению текущего потока."""
+    connection.execute_wrappers.append(profiler)
+
+
+def remove_profiler(profiler):
+    """Снять обертку с соединения текущего потока."""
+    connection.execute_wrappers.remove(profiler)
+
+
+class SQLProfilingMiddleware:
+    """Профилирование запросов к базе без DEBUG.
+
+    Доля PROFILING_SAMPLE_RATE запросов выполняется с оберткой
+    execute_wrapper. По ним в ответ добавляется заголовок Server-Timing,
+    пишется лог в JSON и пополняются гистограммы /api/metrics/.
+    Остальные запросы платят только за вызов random().
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profiler = QueryProfiler()
+        start = time.perf_counter()
+        with connection.execute_wrapper(profiler):
+            response = self.get_response(request)
+        return self._finish(request, response, profiler, start)
+
+    async def __acall__(self, request):
+        """Под ASGI обертка ставится в потоке, где выполняется ORM.
+
+        Django выполняет синхронный код одного запроса в одном потоке,
+        поэтому туда же попадают запросы асинхронного ORM.
+        """
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return await self.get_response(request)
+        profiler = QueryProfiler()
+        start = time.perf_counter()
+        await sync_to_async(install_profiler)(profiler)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(remove_profiler)(profiler)
+        return self._finish(request, response, profiler, start)
+
+    def _finish(self, request, response, profiler, start):
+        """Добавить Server-Timing и записать метрики.
+
+        Для потоковых ответов метрики записываются после отдачи тела.
+        """
+        response['Server-Timing'] = (
+            f'db;dur={profiler.duration * 1000:.1f};'
+            f'desc="{profiler.count} queries", '
+            f'app;dur={(time.perf_counter() - start) * 1000:.1f}'
+        )
+        if not response.streaming:
+            self._record(request, response, profiler, start)
+        elif response.is_async:
+            response.streaming_content = self._astream(
+                response.streaming_content, request, response, profiler,
+                start,
+            )
+        else:
+            response.streaming_content = self._stream(
+                response.streaming_content, request, response, profiler,
+                start,
+            )
+        return response
+
+    def _stream(self, content, request, response, profiler, start):
+        """Учесть запросы, которые выполняются при отдаче тела."""
+        try:
+            with connection.execute_wrapper(profiler):
+                yield from content
+        finally:
+            self._record(request, response, profiler, start)
+
+    async def _astream(self, content, request, response, profiler, start):
+        """Учесть запросы асинхронного итератора тела."""
+        await sync_to_async(install_profiler)(profiler)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            await sync_to_async(remove_profiler)(profiler)
+            self._record(request, response, profiler, start)
+
+    def _record(self, request, response, profiler, start):
+        """Записать метрики и лог запроса."""
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        labels = (match.view_name if match else 'unresolved',
+                  request.method)
+        REQUEST_DURATION.observe(labels, duration)
+        DB_DURATION.observe(labels, profiler.duration)
+        DB_QUERIES.observe(labels, profiler.count)
+        repeated = profiler.repeated(settings.PROFILING_N_PLUS_ONE_THRESHOLD)
+        if repeated:
+            REPEATED_QUERIES.inc(labels)
+        logger.log(
+            logging.WARNING if repeated else logging.INFO,
+            json.dumps({
+                'view': labels[0],
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'db_ms': round(profiler.duration * 1000, 2),
+                'queries': profiler.count,
+                'repeated': [{'sql': sql[:300], 'count': count}
+                             for sql, count in repeated],
+            }, ensure_ascii=False),
+        )
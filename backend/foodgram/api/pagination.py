@@ -1,7 +1,67 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+SEARCH_WITH_CURSOR = ('Результаты поиска упорядочены по релевантности и '
+                      'выводятся только постранично, без курсора.')
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     """Кастомный пагинатор."""
 
     page_size_query_param = 'limit'
+
+
+class RecipeCoveragePagination(CustomPageNumberPagination):
+    """Постраничный вывод подбора рецептов с ограниченным размером."""
+
+    page_size = 6
+    max_page_size = 100
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация рецептов по (pub_date, id) без COUNT(*)."""
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Отказать в курсоре при поиске: он заменил бы порядок по рангу."""
+        if request.query_params.get('search'):
+            raise ValidationError({'search': [SEARCH_WITH_CURSOR]})
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipePagination(CustomPageNumberPagination):
+    """Пагинатор рецептов.
+
+    По умолчанию постраничный, с параметром pagination=cursor
+    или cursor=... переключается на курсорную пагинацию.
+    Курсор строится по дате, поэтому при сортировке ordering=...
+    всегда используется постраничный режим, а поиск search=...
+    с курсором отклоняется.
+    """
+
+    cursor_pagination_class = RecipeCursorPagination
+    ordering_query_param = 'ordering'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Выбрать режим пагинации по параметрам запроса."""
+        self.cursor_paginator = None
+        if self.ordering_query_param in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        if (request.query_params.get('pagination') == 'cursor'
+                or self.cursor_pagination_class.cursor_query_param
+                in request.query_params):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        """Сформировать ответ в выбранном режиме."""
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,82 @@
+import json
+
+from django.conf import settings
+from rest_framework import parsers, status
+from rest_framework.exceptions import APIException, ParseError
+
+
+class RequestTooLarge(APIException):
+    """Тело запроса больше допустимого."""
+
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Тело запроса слишком большое.'
+    default_code = 'request_too_large'
+
+
+class SizeLimitMixin:
+    """Отказ по Content-Length до разбора тела.
+
+    Парсеры DRF читают поток запроса напрямую, поэтому
+    DATA_UPLOAD_MAX_MEMORY_SIZE Django их не ограничивает. Без
+    Content-Length Django отдает пустой поток, так что заголовка
+    достаточно. Предел берется из настройки max_size_setting.
+    """
+
+    max_size_setting = 'DATA_UPLOAD_MAX_MEMORY_SIZE'
+
+    def check_size(self, parser_context):
+        """Вызвать RequestTooLarge, если тело больше предела."""
+        max_size = getattr(settings, self.max_size_setting)
+        request = (parser_context or {}).get('request')
+        if max_size is None or request is None:
+            return
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > max_size:
+            raise RequestTooLarge(f'Тело запроса больше {max_size} байт.')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        self.check_size(parser_context)
+        return super().parse(stream, media_type, parser_context)
+
+
+class JSONParser(SizeLimitMixin, parsers.JSONParser):
+    """JSON-парсер с пределом размера тела."""
+
+
+class FormParser(SizeLimitMixin, parsers.FormParser):
+    """Парсер форм с пределом размера тела."""
+
+
+class MultiPartParser(SizeLimitMixin, parsers.MultiPartParser):
+    """Multipart-парсер с пределом размера тела."""
+
+
+class BulkJSONParser(JSONParser):
+    """JSON-парсер пакетной загрузки с отдельным пределом."""
+
+    max_size_setting = 'RECIPE_BULK_MAX_SIZE'
+
+
+class NDJSONParser(SizeLimitMixin, parsers.BaseParser):
+    """Парсер NDJSON: по JSON-объекту в строке, результат - список."""
+
+    media_type = 'application/x-ndjson'
+    max_size_setting = 'RECIPE_BULK_MAX_SIZE'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        self.check_size(parser_context)
+        encoding = (parser_context or {}).get('encoding',
+                                              settings.DEFAULT_CHARSET)
+        items = []
+        for number, line in enumerate(stream, 1):
+            line = line.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as error:
+                raise ParseError(f'Строка {number}: {error}')
+        return items
@@ -1,13 +1,19 @@
 import base64
+import binascii
+import math
 import re
 
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
 
+from recipes.images import schedule_renditions
 from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
-                            Recipe, ShoppingList, Tag)
+                            Recipe, ShoppingList, Tag, TagRecipe)
 from users.models import User
 
 
@@ -23,6 +29,40 @@ class IngredientSerializer(serializers.ModelSerializer):
         model = Ingredient
 
 
+class IngredientAutocompleteSerializer(serializers.Serializer):
+    """Параметры автодополнения ингредиентов."""
+
+    name = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+
+class BulkParamsSerializer(serializers.Serializer):
+    """Параметры пакетной загрузки рецептов."""
+
+    batch_size = serializers.IntegerField(min_value=1, max_value=5000,
+                                          required=False)
+
+
+class IngredientCoverageParamsSerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=100,
+    )
+
+
+class SimilarRecipesParamsSerializer(serializers.Serializer):
+    """Параметры выдачи похожих рецептов."""
+
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.RECIPE_SIMILAR_TOP_K,
+        default=settings.RECIPE_SIMILAR_TOP_K,
+    )
+
+
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор тегов."""
 
@@ -62,6 +102,10 @@ class CustomUserSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         """Проверить подписку."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        if self.context.get('memberships') is not None:
+            return obj.id in self.context['memberships']['follows']
         user = self.context['request'].user
         return user.is_authenticated and user.follower.filter(
             following=obj).exists()
@@ -97,30 +141,83 @@ class Base64ImageField(serializers.ImageField):
     """Поле изображения."""
 
     def to_internal_value(self, data):
-        """Декодирует изображение."""
+        """Декодирует изображение, ограничивая размер до декодирования."""
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, _, imgstr = data.partition(';base64,')
             ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            max_size = settings.RECIPE_IMAGE_MAX_SIZE
+            if len(imgstr) > 4 * math.ceil(max_size / 3):
+                raise serializers.ValidationError(
+                    f'Размер изображения больше {max_size} байт.'
+                )
+            try:
+                decoded = base64.b64decode(imgstr, validate=True)
+            except binascii.Error:
+                raise serializers.ValidationError(
+                    'Изображение должно быть в формате base64.'
+                )
+
+            data = ContentFile(decoded, name='temp.' + ext)
 
         return super().to_internal_value(data)
 
 
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии фото по форматам и ширине."""
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        renditions = {}
+        for extension, names in value.items():
+            renditions[extension] = {}
+            for width, name in names.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                renditions[extension][width] = url
+        return renditions
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта."""
 
     is_favorited = serializers.BooleanField(read_only=True)
     is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    image_renditions = ImageRenditionsField()
     tags = TagSerializer(many=True)
     author = CustomUserSerializer()
     ingredients = IngredientRecipeSerializer(source='ingredientrecipe_set',
                                              many=True, read_only=True)
 
     class Meta:
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'favorites_count', 'shopping_count',
+                   'trending_score', 'search_vector')
         model = Recipe
 
+    def to_representation(self, instance):
+        """Передать аннотацию подписки автору.
+
+        Если в контексте есть множества пользователя, флаги берутся
+        из них вместо подзапросов EXISTS.
+        """
+        memberships = self.context.get('memberships')
+        if memberships is not None:
+            instance.is_favorited = instance.pk in memberships['favorites']
+            instance.is_in_shopping_cart = instance.pk in memberships['cart']
+            instance.author_is_subscribed = (
+                instance.author_id in memberships['follows']
+            )
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+
+class RecipeCoverageSerializer(RecipeSerializer):
+    """Рецепт с покрытием набора ингредиентов."""
+
+    ingredients_matched = serializers.IntegerField(read_only=True)
+    ingredients_missing = serializers.IntegerField(read_only=True)
+
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта для записи."""
@@ -129,10 +226,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
     author = CustomUserSerializer(
         read_only=True, default=CurrentUserDefault())
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
     ingredients = IngredientRecipeWriteSerializer(
         many=True,
@@ -140,19 +234,60 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     )
 
     class Meta:
-        exclude = ('pub_date',)
+        exclude = ('pub_date', 'favorites_count', 'shopping_count',
+                   'trending_score', 'search_vector', 'image_renditions')
         read_only_fields = (
             'author',
         )
         model = Recipe
 
+    def _in_bulk(self, model, ids):
+        """Получить объекты по id.
+
+        При пакетной загрузке объекты всей пачки заранее передаются
+        в контексте prefetched, иначе выполняется один запрос IN.
+        """
+        prefetched = self.context.get('prefetched', {}).get(model)
+        if prefetched is not None:
+            return prefetched
+        return model.objects.in_bulk(ids)
+
+    def validate_tags(self, value):
+        """Получить теги одним запросом, отметив несуществующие."""
+        tags = self._in_bulk(Tag, value)
+        errors = {
+            index: [f'Тега с id {tag_id} не существует.']
+            for index, tag_id in enumerate(value) if tag_id not in tags
+        }
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [tags[tag_id] for tag_id in value]
+
+    def validate_ingredients(self, value):
+        """Получить ингредиенты одним запросом, отметив несуществующие."""
+        ingredients = self._in_bulk(
+            Ingredient, [ingredient['id'] for ingredient in value]
+        )
+        errors = {
+            index: {'id': [
+                f'Ингредиента с id {ingredient["id"]} не существует.'
+            ]}
+            for index, ingredient in enumerate(value)
+            if ingredient['id'] not in ingredients
+        }
+        if errors:
+            raise serializers.ValidationError(errors)
+        for ingredient in value:
+            ingredient['ingredient'] = ingredients[ingredient['id']]
+        return value
+
     def validate(self, attrs):
         """Валидация данных."""
-        tags = self.initial_data.get('tags')
-        ingredients = self.initial_data.get('ingredients')
-        ingredients_id_list = []
-        for ingredient in ingredients:
-            ingredients_id_list.append(ingredient.get('id'))
+        tags = [tag.id for tag in attrs.get('tags', ())]
+        ingredients = attrs.get('ingredientinrecipe_set')
+        ingredients_id_list = [
+            ingredient['id'] for ingredient in ingredients or ()
+        ]
         if not tags:
             raise serializers.ValidationError(
                 'У рецепта должен быть хотя бы один тег.')
@@ -177,49 +312,119 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                                            recipe=obj).exists()
 
     def to_representation(self, instance):
-        """Изменение представления."""
+        """Изменение представления.
+
+        Теги и ингредиенты берутся из только что записанных объектов.
+        UpdateModelMixin сбрасывает кеш предзагрузки после сохранения,
+        поэтому он заполняется заново здесь.
+        """
+        if getattr(self, '_written_related', None):
+            instance._prefetched_objects_cache = dict(self._written_related)
         serializer = RecipeSerializer(
             instance,
-            context={'request': self.context.get('request')}
+            context={'request': self.context.get('request'),
+                     'memberships': self.context.get('memberships')}
         )
         return serializer.data
 
-    def _add_ingredients(self, recipe, ingredients):
-        """Добавить список ингредиентов рецепта."""
-        data = []
-        for ingredient in ingredients:
-            data.append(IngredientRecipe(
-                recipe=recipe,
-                ingredient_id=ingredient['id'],
-                amount=ingredient['amount']
-            ))
-        IngredientRecipe.objects.bulk_create(data)
+    def _set_tags(self, recipe, tags, current=()):
+        """Сохранить теги рецепта, меняя только отличающиеся связи."""
+        current_ids = {tag.id for tag in current}
+        new_ids = {tag.id for tag in tags}
+        if current_ids - new_ids:
+            TagRecipe.objects.filter(
+                recipe=recipe, tag_id__in=current_ids - new_ids
+            ).delete()
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag=tag)
+            for tag in tags if tag.id not in current_ids
+        )
+        self._cache_related(recipe, 'tags', tags)
 
+    def _set_ingredients(self, recipe, ingredients, current=()):
+        """Сохранить ингредиенты рецепта, меняя только отличающиеся строки."""
+        current = {row.ingredient_id: row for row in current}
+        rows, created, updated = [], [], []
+        for ingredient in ingredients:
+            row = current.pop(ingredient['id'], None)
+            if row is None:
+                row = IngredientRecipe(recipe=recipe,
+                                       amount=ingredient['amount'])
+                created.append(row)
+            elif row.amount != ingredient['amount']:
+                row.amount = ingredient['amount']
+                updated.append(row)
+            row.ingredient = ingredient['ingredient']
+            rows.append(row)
+        if current:
+            IngredientRecipe.objects.filter(
+                pk__in=[row.pk for row in current.values()]
+            ).delete()
+        IngredientRecipe.objects.bulk_create(created)
+        IngredientRecipe.objects.bulk_update(updated, ('amount',))
+        self._cache_related(recipe, 'ingredientrecipe_set', rows)
+
+    def _cache_related(self, recipe, name, objects):
+        """Запомнить записанные связанные объекты для ответа."""
+        self._written_related = getattr(self, '_written_related', {})
+        self._written_related[name] = list(objects)
+
+    @transaction.atomic
     def create(self, validated_data):
         """Создание нового объекта."""
         ingredients = validated_data.pop('ingredientinrecipe_set')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        for tag in tags:
-            recipe.tags.add(tag)
-        self._add_ingredients(recipe, ingredients)
+        self._set_tags(recipe, tags)
+        self._set_ingredients(recipe, ingredients)
+        recipe.is_favorited = False
+        recipe.is_in_shopping_cart = False
+        recipe.author_is_subscribed = False
+        schedule_renditions(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        """Редактирование объекта."""
+        """Редактирование объекта.
+
+        Экземпляр получен из RecipeViewSet с предзагруженными тегами и
+        ингредиентами, поэтому сравнение с текущими данными не требует
+        дополнительных запросов. Записываются только редактируемые
+        колонки: счетчики и рейтинг экземпляра могли устареть.
+        """
         instance.image = validated_data.get('image', instance.image)
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get('cooking_time',
                                                    instance.cooking_time)
-        ingredients = validated_data.pop('ingredientinrecipe_set')
-        instance.tags.set(validated_data.pop('tags'))
-        instance.ingredients.clear()
-        instance.save()
-        self._add_ingredients(instance, ingredients)
+        update_fields = ['name', 'text', 'cooking_time', 'image']
+        stale_renditions = None
+        if 'image' in validated_data:
+            stale_renditions = instance.image_renditions
+            instance.image_renditions = {}
+            update_fields.append('image_renditions')
+        instance.save(update_fields=update_fields)
+        self._set_tags(instance, validated_data.pop('tags'),
+                       instance.tags.all())
+        self._set_ingredients(instance,
+                              validated_data.pop('ingredientinrecipe_set'),
+                              instance.ingredientrecipe_set.all())
+        if stale_renditions is not None:
+            schedule_renditions(instance, stale_renditions)
         return instance
 
 
+class RecipeBulkItemSerializer(RecipeWriteSerializer):
+    """Сериализатор рецепта для пакетной загрузки.
+
+    Уникальность названий проверяется для всей пачки одним запросом,
+    автор задается загрузчиком, а не текущим пользователем запроса.
+    """
+
+    name = serializers.CharField(max_length=200)
+    author = None
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     """Сериализатор избранного."""
 
@@ -237,21 +442,21 @@ class FavoriteSerializer(serializers.ModelSerializer):
         )
         model = Favorite
 
+    duplicate_message = 'Вы уже добавили в избранное!'
+
     def validate(self, data):
-        """Валидация данных."""
-        if (self.context['request'].method == "POST"
-                and Favorite.objects.filter(
-                    user=self.context['request'].user,
-                    recipe_id=self.context['recipe_id']
-        ).exists()):
-            raise serializers.ValidationError(
-                'Вы уже добавили в избранное!'
-            )
-        if (self.context['request'].method == "DELETE" and not
-            Favorite.objects.filter(
-                user=self.context['request'].user,
-                recipe_id=self.context['recipe_id']
-        ).exists()):
+        """Валидация данных.
+
+        Проверка идет по базе, а не по закешированным множествам:
+        кеш может отставать от записи в другом процессе.
+        """
+        request = self.context['request']
+        exists = Favorite.objects.filter(
+            user=request.user, recipe_id=self.context['recipe_id']
+        ).exists()
+        if request.method == "POST" and exists:
+            raise serializers.ValidationError(self.duplicate_message)
+        if request.method == "DELETE" and not exists:
             raise serializers.ValidationError(
                 'Этот рецепт не в избранном.'
             )
@@ -263,13 +468,22 @@ class RecipeShortSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField()
     name = serializers.ReadOnlyField()
     image = serializers.ImageField(read_only=True)
+    image_renditions = ImageRenditionsField()
     cooking_time = serializers.ReadOnlyField()
 
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         model = Recipe
 
 
+def get_recipes_limit(request):
+    """Получить ограничение количества рецептов автора из запроса."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit and recipes_limit.isdigit() and int(recipes_limit) > 0:
+        return int(recipes_limit)
+    return None
+
+
 class FollowSerializer(serializers.ModelSerializer):
     """Сериализатор подписок."""
 
@@ -295,26 +509,22 @@ class FollowSerializer(serializers.ModelSerializer):
         )
         model = Follow
 
+    duplicate_message = 'Такая подписка уже есть.'
+
     def validate(self, data):
-        """Валидация данных."""
-        if self.context['request'].method == "POST" and Follow.objects.filter(
-                user=self.context['request'].user,
-                following_id=self.context['user_id']
-        ).exists():
-            raise serializers.ValidationError(
-                'Такая подписка уже есть.'
-            )
-        if (self.context['request'].method == "POST"
-                and self.context['request'].user.id
-                == self.context['user_id']):
+        """Валидация данных по базе, как у FavoriteSerializer."""
+        request = self.context['request']
+        exists = Follow.objects.filter(
+            user=request.user, following_id=self.context['user_id']
+        ).exists()
+        if request.method == "POST" and exists:
+            raise serializers.ValidationError(self.duplicate_message)
+        if (request.method == "POST"
+                and request.user.id == self.context['user_id']):
             raise serializers.ValidationError(
                 'На себя нельзя подписаться.'
             )
-        if (self.context['request'].method == "DELETE" and not
-            Follow.objects.filter(
-                user=self.context['request'].user,
-                following_id=self.context['user_id']
-        ).exists()):
+        if request.method == "DELETE" and not exists:
             raise serializers.ValidationError(
                 'Такой подписки нет.'
             )
@@ -322,23 +532,23 @@ class FollowSerializer(serializers.ModelSerializer):
 
     def get_recipes(self, obj):
         """Получить связанные рецепты."""
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit'
-        )
-        queryset = obj.following.recipes.all()
-        if recipes_limit:
-            queryset = queryset[:int(recipes_limit)]
+        queryset = getattr(obj.following, 'latest_recipes', None)
+        if queryset is None:
+            recipes_limit = get_recipes_limit(self.context['request'])
+            queryset = obj.following.recipes.all()[:recipes_limit]
         serializer = RecipeShortSerializer(queryset, many=True)
         return serializer.data
 
     def get_is_subscribed(self, obj):
-        """Проверить подписку."""
-        return Follow.objects.filter(user=self.context['request'].user,
-                                     following=obj.following).exists()
+        """Проверить подписку.
+
+        Сериализуются только подписки текущего пользователя.
+        """
+        return obj.user_id == self.context['request'].user.id
 
     def get_recipes_count(self, obj):
         """Получить счетчит рецептов."""
-        return obj.following.recipes.count()
+        return obj.following.recipes_count
 
 
 class ShoppingCardSerializer(serializers.ModelSerializer):
@@ -353,21 +563,17 @@ class ShoppingCardSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
         model = ShoppingList
 
+    duplicate_message = 'Уже добавлен в список покупок.'
+
     def validate(self, data):
-        """Валидация данных."""
-        if (self.context['request'].method == "POST"
-                and ShoppingList.objects.filter(
-                    user=self.context['request'].user,
-                    recipe_id=self.context['recipe_id']
-        ).exists()):
-            raise serializers.ValidationError(
-                'Уже добавлен в список покупок.'
-            )
-        if (self.context['request'].method == "DELETE" and not
-            ShoppingList.objects.filter(
-                user=self.context['request'].user,
-                recipe_id=self.context['recipe_id']
-        ).exists()):
+        """Валидация данных по базе, как у FavoriteSerializer."""
+        request = self.context['request']
+        exists = ShoppingList.objects.filter(
+            user=request.user, recipe_id=self.context['recipe_id']
+        ).exists()
+        if request.method == "POST" and exists:
+            raise serializers.ValidationError(self.duplicate_message)
+        if request.method == "DELETE" and not exists:
             raise serializers.ValidationError(
                 'Этого рецепта нет в списке покупок.'
             )
@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import bump_recipe_versions, bump_reference_version
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def reset_ingredients_cache(**kwargs):
+    """Сбросить кеш ингредиентов, индекс автодополнения и рецептов."""
+    bump_reference_version('ingredients')
+    bump_recipe_versions(everything=True)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def reset_tags_cache(**kwargs):
+    """Сбросить кеш тегов и рецептов."""
+    bump_reference_version('tags')
+    bump_recipe_versions(everything=True)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def reset_recipe_cache(sender, instance, **kwargs):
+    """Сбросить кеш рецепта и списков рецептов.
+
+    Покрывает и теги с ингредиентами: API и админка сохраняют рецепт
+    в одной транзакции со связями, а сброс идет после коммита.
+    На связующие модели сигналы не вешаются, чтобы их удаление
+    оставалось быстрым DELETE без загрузки строк.
+    """
+    bump_recipe_versions([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def reset_author_cache(sender, instance, created, update_fields=None,
+                       **kwargs):
+    """Сбросить кеш рецептов автора при изменении его данных."""
+    if created or update_fields and not AUTHOR_FIELDS & set(update_fields):
+        return
+    recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    if recipe_ids:
+        bump_recipe_versions(recipe_ids)
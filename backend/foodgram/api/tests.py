@@ -0,0 +1,700 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin import site
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, FloatField, Value
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.benchmark import PNG_1PX
+from api.bulk import NAME_TAKEN, RecipeBulkCreator
+from api.cache import get_reference_version
+from api.filters import RecipeFilter
+from api.metrics import (AGGREGATE_FILE, REPEATED_QUERIES, REQUEST_DURATION,
+                         collect_series, fold_worker_metrics, render_metrics)
+from api.serializers import RecipeWriteSerializer
+from recipes.admin import RecipeAdmin
+from recipes.memberships import get_memberships, load_memberships
+from recipes.models import (Favorite, Follow, Ingredient, IngredientRecipe,
+                            Recipe, ShoppingList, Tag, TagRecipe)
+from users.models import User
+
+RECIPES = 15
+# Аноним: COUNT и страница рецептов с автором, теги, ингредиенты.
+# Читатель дополнительно: токен и множества избранного, покупок
+# и подписок. У карточки нет COUNT.
+LIST_QUERIES = {'anon': 4, 'reader': 6}
+DETAIL_QUERIES = {'anon': 3, 'reader': 5}
+
+
+class RecipeQueryCountTest(TestCase):
+    """Число запросов к базе у списка и карточки рецепта.
+
+    Число не должно зависеть от размера страницы: связи рецептов
+    читаются prefetch, флаги пользователя - одним запросом.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [
+            User.objects.create(username=f'author{number}',
+                                email=f'author{number}@foodgram.ru',
+                                first_name='Автор', last_name='Рецептов')
+            for number in range(3)
+        ]
+        cls.reader = User.objects.create(
+            username='reader', email='reader@foodgram.ru',
+            first_name='Читатель', last_name='Рецептов',
+        )
+        tags = [Tag.objects.create(name=f'Тег {number}',
+                                   color=f'#00000{number}',
+                                   slug=f'tag{number}')
+                for number in range(3)]
+        ingredients = [Ingredient.objects.create(name=f'Ингредиент {number}',
+                                                 measurement_unit='г')
+                       for number in range(10)]
+        for number in range(RECIPES):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', author=authors[number % 3],
+                image='backend-media/recipes/images/recipe.png',
+                text='Описание', cooking_time=10,
+            )
+            TagRecipe.objects.bulk_create(
+                TagRecipe(recipe=recipe, tag=tag)
+                for tag in tags[:number % 3 + 1]
+            )
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                                 amount=number + 1)
+                for ingredient in ingredients[number % 5:number % 5 + 4]
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.reader, recipe=recipe)
+            if number % 3:
+                ShoppingList.objects.create(user=cls.reader, recipe=recipe)
+        Follow.objects.create(user=cls.reader, following=authors[0])
+        cls.recipe = recipe
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        # Ответы анонимам и множества пользователя кешируются, замер
+        # идет по первому, некешированному запросу.
+        cache.clear()
+        self.clients = {'anon': APIClient(), 'reader': APIClient()}
+        self.clients['reader'].credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for name, client in self.clients.items():
+            for limit in (6, 12):
+                with self.subTest(user=name, limit=limit):
+                    cache.clear()
+                    with self.assertNumQueries(LIST_QUERIES[name]):
+                        response = client.get(f'/api/recipes/?limit={limit}')
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.json()['results']), limit)
+
+    def test_detail_queries(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        for name, client in self.clients.items():
+            with self.subTest(user=name):
+                cache.clear()
+                with self.assertNumQueries(DETAIL_QUERIES[name]):
+                    response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    def test_user_flags(self):
+        response = self.clients['reader'].get('/api/recipes/?limit=12')
+        flags = {
+            recipe['id']: (recipe['is_favorited'],
+                           recipe['is_in_shopping_cart'],
+                           recipe['author']['is_subscribed'])
+            for recipe in response.json()['results']
+        }
+        for recipe in Recipe.objects.filter(pk__in=flags):
+            with self.subTest(recipe=recipe.name):
+                self.assertEqual(flags[recipe.pk], (
+                    Favorite.objects.filter(user=self.reader,
+                                            recipe=recipe).exists(),
+                    ShoppingList.objects.filter(user=self.reader,
+                                                recipe=recipe).exists(),
+                    recipe.author.username == 'author0',
+                ))
+
+
+class RecipeUpdateTest(TestCase):
+    """Редактирование рецепта записывает только изменившиеся данные."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@foodgram.ru',
+            first_name='Автор', last_name='Рецептов', is_staff=True,
+            is_superuser=True,
+        )
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       color=f'#00000{number}',
+                                       slug=f'tag{number}')
+                    for number in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(3)
+        ]
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', author=cls.author,
+            image='backend-media/recipes/images/recipe.png',
+            text='Описание', cooking_time=10,
+        )
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=cls.recipe, tag=tag) for tag in cls.tags[:2]
+        )
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=cls.recipe, ingredient=ingredient,
+                             amount=10)
+            for ingredient in cls.ingredients[:2]
+        )
+
+    def setUp(self):
+        self.request = APIRequestFactory().patch('/')
+        self.request.user = self.author
+
+    def load_stale_recipe(self):
+        """Рецепт, счетчики которого увеличились после чтения."""
+        recipe = Recipe.objects.prefetch_related(
+            'tags', 'ingredientrecipe_set'
+        ).get(pk=self.recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            favorites_count=F('favorites_count') + 5,
+            shopping_count=F('shopping_count') + 3,
+        )
+        return recipe
+
+    def update(self, recipe, tags, ingredients, **fields):
+        serializer = RecipeWriteSerializer(
+            recipe,
+            data={'tags': [tag.pk for tag in tags],
+                  'ingredients': [{'id': ingredient.pk, 'amount': amount}
+                                  for ingredient, amount in ingredients],
+                  **fields},
+            partial=True,
+            context={'request': self.request},
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_api_update_keeps_counters(self):
+        recipe = self.load_stale_recipe()
+        self.update(recipe, self.tags[:1], [(self.ingredients[0], 10)],
+                    name='Новое название')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual((recipe.favorites_count, recipe.shopping_count),
+                         (5, 3))
+
+    def test_admin_update_keeps_counters(self):
+        recipe = self.load_stale_recipe()
+        model_admin = RecipeAdmin(Recipe, site)
+        form = model_admin.get_form(self.request, recipe, change=True)(
+            data={'name': 'Из админки', 'author': self.author.pk,
+                  'text': 'Описание', 'cooking_time': 20},
+            instance=recipe,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        model_admin.save_model(self.request, form.save(commit=False), form,
+                               change=True)
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.name, recipe.cooking_time),
+                         ('Из админки', 20))
+        self.assertEqual((recipe.favorites_count, recipe.shopping_count),
+                         (5, 3))
+
+    def test_relations_are_diffed(self):
+        kept_tag = TagRecipe.objects.get(recipe=self.recipe,
+                                         tag=self.tags[0])
+        kept_ingredient = IngredientRecipe.objects.get(
+            recipe=self.recipe, ingredient=self.ingredients[0]
+        )
+        recipe = self.update(
+            self.load_stale_recipe(), [self.tags[0], self.tags[2]],
+            [(self.ingredients[0], 25), (self.ingredients[2], 5)],
+        )
+        self.assertEqual(
+            dict(TagRecipe.objects.filter(
+                recipe=recipe
+            ).values_list('tag', 'pk')),
+            {self.tags[0].pk: kept_tag.pk,
+             self.tags[2].pk: TagRecipe.objects.get(recipe=recipe,
+                                                    tag=self.tags[2]).pk},
+        )
+        rows = {row.ingredient_id: row
+                for row in IngredientRecipe.objects.filter(recipe=recipe)}
+        self.assertEqual(set(rows), {self.ingredients[0].pk,
+                                     self.ingredients[2].pk})
+        self.assertEqual(rows[self.ingredients[0].pk].pk, kept_ingredient.pk)
+        self.assertEqual(rows[self.ingredients[0].pk].amount, 25)
+        self.assertEqual(rows[self.ingredients[2].pk].amount, 5)
+
+    def test_unchanged_relations_are_not_written(self):
+        recipe = self.load_stale_recipe()
+        tables = (TagRecipe._meta.db_table, IngredientRecipe._meta.db_table)
+        with CaptureQueriesContext(connection) as queries:
+            self.update(recipe, self.tags[:2],
+                        [(ingredient, 10)
+                         for ingredient in self.ingredients[:2]],
+                        name='Новое название')
+        self.assertEqual(
+            [query['sql'] for query in queries
+             if any(table in query['sql'] for table in tables)],
+            [],
+        )
+
+
+class ReferenceCacheTest(TestCase):
+    """Версия справочника меняется только после коммита записи."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_tag_version_changes_on_commit(self):
+        client = APIClient()
+        version = get_reference_version('tags')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Завтрак', color='#E26C2D',
+                               slug='breakfast')
+            self.assertEqual(get_reference_version('tags'), version)
+        self.assertNotEqual(get_reference_version('tags'), version)
+        response = client.get('/api/tags/')
+        self.assertEqual([tag['slug'] for tag in response.json()],
+                         ['breakfast'])
+
+
+class MembershipFlagsTest(TestCase):
+    """Флаги избранного и покупок сразу после добавления и удаления."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author',
+                                     email='author@foodgram.ru')
+        cls.reader = User.objects.create(username='reader',
+                                         email='reader@foodgram.ru')
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', author=author,
+            image='backend-media/recipes/images/recipe.png',
+            text='Описание', cooking_time=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def flags(self):
+        """Флаги рецепта в карточке и в списке."""
+        detail = self.client.get(f'/api/recipes/{self.recipe.pk}/').json()
+        listed = self.client.get('/api/recipes/?limit=6').json()['results'][0]
+        return [{flag: recipe[flag] for flag in ('is_favorited',
+                                                 'is_in_shopping_cart')}
+                for recipe in (detail, listed)]
+
+    def test_flags_follow_writes(self):
+        for action, flag in (('favorite', 'is_favorited'),
+                             ('shopping_cart', 'is_in_shopping_cart')):
+            url = f'/api/recipes/{self.recipe.pk}/{action}/'
+            for method, status, expected in (('post', 201, True),
+                                             ('delete', 204, False)):
+                with self.subTest(action=action, method=method):
+                    self.flags()
+                    with self.captureOnCommitCallbacks(execute=True):
+                        response = getattr(self.client, method)(url)
+                    self.assertEqual(response.status_code, status)
+                    for flags in self.flags():
+                        self.assertIs(flags[flag], expected)
+
+    def test_sets_loaded_before_commit_are_not_cached(self):
+        def load_then_commit(user_id):
+            memberships = load_memberships(user_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                Favorite.objects.create(user=self.reader, recipe=self.recipe)
+            return memberships
+
+        with mock.patch('recipes.memberships.load_memberships',
+                        side_effect=load_then_commit):
+            self.assertEqual(get_memberships(self.reader)['favorites'],
+                             set())
+        self.assertEqual(get_memberships(self.reader)['favorites'],
+                         {self.recipe.pk})
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeCacheInvalidationTest(TestCase):
+    """Кешированные ответы анонимам меняются после коммита записи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author',
+                                         email='author@foodgram.ru')
+        cls.tags = [Tag.objects.create(name=f'Тег {number}',
+                                       color=f'#00000{number}',
+                                       slug=f'tag{number}')
+                    for number in range(2)]
+        cls.ingredient = Ingredient.objects.create(name='Ингредиент',
+                                                   measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', author=cls.author,
+            image='backend-media/recipes/images/recipe.png',
+            text='Описание', cooking_time=10,
+        )
+        TagRecipe.objects.create(recipe=cls.recipe, tag=cls.tags[0])
+        IngredientRecipe.objects.create(recipe=cls.recipe,
+                                        ingredient=cls.ingredient, amount=10)
+
+    def setUp(self):
+        cache.clear()
+        self.anon = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.detail_url = f'/api/recipes/{self.recipe.pk}/'
+
+    def cached(self, url):
+        """Ответ анониму, второй раз отданный из кеша."""
+        self.anon.get(url)
+        with self.assertNumQueries(0):
+            return self.anon.get(url)
+
+    def test_patch_updates_cached_responses(self):
+        self.cached('/api/recipes/?limit=6')
+        self.cached(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.detail_url, {
+                'name': 'Новое название',
+                'tags': [self.tags[1].pk],
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 20}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        detail = self.cached(self.detail_url).json()
+        listed = self.cached('/api/recipes/?limit=6').json()['results'][0]
+        for recipe in (detail, listed):
+            self.assertEqual(recipe['name'], 'Новое название')
+            self.assertEqual([tag['slug'] for tag in recipe['tags']],
+                             ['tag1'])
+            self.assertEqual(recipe['ingredients'][0]['amount'], 20)
+
+    def test_delete_updates_cached_responses(self):
+        self.cached('/api/recipes/?limit=6')
+        self.cached(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(self.detail_url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.anon.get(self.detail_url).status_code, 404)
+        self.assertEqual(
+            self.anon.get('/api/recipes/?limit=6').json()['results'], []
+        )
+
+
+class RecipeSearchTest(TestCase):
+    """Поиск не теряет порядок по релевантности."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author',
+                                     email='author@foodgram.ru')
+        for number in range(2):
+            Recipe.objects.create(
+                name=f'Рецепт {number}', author=author,
+                image='backend-media/recipes/images/recipe.png',
+                text='Описание', cooking_time=10,
+            )
+
+    def test_ordering_breaks_rank_ties(self):
+        queryset = Recipe.objects.annotate(
+            search_rank=Value(1.0, output_field=FloatField())
+        ).order_by('-search_rank')
+        recipes = RecipeFilter({'ordering': 'popular'},
+                               queryset=queryset).qs
+        self.assertEqual(recipes.query.order_by,
+                         ('-search_rank', '-favorites_count', '-pub_date',
+                          '-id'))
+
+    def test_cursor_with_search_is_rejected(self):
+        client = APIClient()
+        response = client.get('/api/recipes/?search=Рецепт&limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        for query in ('pagination=cursor', 'cursor=cD0x'):
+            with self.subTest(query=query):
+                response = client.get(f'/api/recipes/?search=Рецепт&{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('search', response.json())
+
+
+class ImportDataTest(TestCase):
+    """Повторный импорт рецептов заменяет их теги и ингредиенты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(username='author', email='author@foodgram.ru')
+        for number in range(2):
+            Tag.objects.create(name=f'Тег {number}', color=f'#00000{number}',
+                               slug=f'tag{number}')
+        for number in range(3):
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+
+    def import_recipe(self, tags, ingredients):
+        recipe = {'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+                  'tags': tags,
+                  'ingredients': [{'name': name, 'amount': amount}
+                                  for name, amount in ingredients]}
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write(json.dumps(recipe, ensure_ascii=False) + '\n')
+            file.flush()
+            call_command('import_data', recipes=file.name,
+                         author='author@foodgram.ru', stdout=StringIO())
+        return Recipe.objects.get(name='Рецепт')
+
+    def test_reimport_replaces_links(self):
+        self.import_recipe(['tag0', 'tag1'], [('Ингредиент 0', 10),
+                                              ('Ингредиент 1', 20)])
+        recipe = self.import_recipe(['tag1'], [('Ингредиент 1', 30),
+                                               ('Ингредиент 2', 5)])
+        self.assertEqual(
+            list(recipe.tags.values_list('slug', flat=True)), ['tag1']
+        )
+        self.assertEqual(
+            dict(recipe.ingredientrecipe_set.values_list('ingredient__name',
+                                                         'amount')),
+            {'Ингредиент 1': 30, 'Ингредиент 2': 5},
+        )
+
+
+class RecipeBulkTest(TestCase):
+    """Пакетная загрузка возвращает результат по каждому рецепту."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(
+            username='admin', email='admin@foodgram.ru', is_staff=True,
+            is_superuser=True,
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='Соль',
+                                                   measurement_unit='г')
+        Recipe.objects.create(
+            name='Занятое', author=cls.admin,
+            image='backend-media/recipes/images/recipe.png',
+            text='Описание', cooking_time=10,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def item(self, name, **fields):
+        return {'name': name, 'text': 'Описание', 'cooking_time': 5,
+                'image': PNG_1PX, 'tags': [self.tag.pk],
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 10}],
+                **fields}
+
+    def post(self, items):
+        response = self.client.post('/api/recipes/bulk/?batch_size=2',
+                                    items, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100)
+    def test_body_size_limits(self):
+        response = self.client.post('/api/recipes/', self.item('Большой'),
+                                    format='json')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.post([self.item('Большой')])['created'], 1)
+        with override_settings(RECIPE_BULK_MAX_SIZE=100):
+            for body, content_type in (
+                (json.dumps([self.item('Другой')]), 'application/json'),
+                (json.dumps(self.item('Другой')), 'application/x-ndjson'),
+            ):
+                with self.subTest(content_type=content_type):
+                    response = self.client.post(
+                        '/api/recipes/bulk/', body, content_type=content_type
+                    )
+                    self.assertEqual(response.status_code, 413)
+
+    def test_results_per_item(self):
+        report = self.post([
+            self.item('Первый'), self.item('Без тегов', tags=[]),
+            self.item('Занятое'), self.item('Второй'),
+            self.item('Второй'),
+        ])
+        self.assertEqual((report['created'], report['failed']), (2, 3))
+        results = report['results']
+        self.assertEqual([result['index'] for result in results],
+                         list(range(5)))
+        self.assertEqual([sorted(result) for result in results], [
+            ['id', 'index'], ['errors', 'index'], ['errors', 'index'],
+            ['id', 'index'], ['errors', 'index'],
+        ])
+        recipe = Recipe.objects.get(pk=results[3]['id'])
+        self.assertEqual(recipe.name, 'Второй')
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertEqual(
+            list(recipe.ingredientrecipe_set.values_list('ingredient',
+                                                         'amount')),
+            [(self.ingredient.pk, 10)],
+        )
+
+    def test_name_taken_during_insert(self):
+        validate_batch = RecipeBulkCreator._validate_batch
+
+        def validate_then_take_name(creator, batch, offset):
+            result = validate_batch(creator, batch, offset)
+            Recipe.objects.create(
+                name='Параллельный', author=self.admin,
+                image='backend-media/recipes/images/recipe.png',
+                text='Описание', cooking_time=10,
+            )
+            return result
+
+        with mock.patch.object(RecipeBulkCreator, '_validate_batch',
+                               validate_then_take_name):
+            report = self.post([self.item('Параллельный'),
+                                self.item('Свободный')])
+        first, second = report['results']
+        self.assertEqual(first['errors'], {'name': [NAME_TAKEN]})
+        self.assertTrue(Recipe.objects.filter(pk=second['id'],
+                                              name='Свободный').exists())
+
+
+class RecipeFeedTest(TestCase):
+    """Лента подписок совпадает с рецептами авторов по дате."""
+
+    @classmethod
+    def setUpTestData(cls):
+        authors = [User.objects.create(username=f'author{number}',
+                                       email=f'author{number}@foodgram.ru')
+                   for number in range(4)]
+        cls.reader = User.objects.create(username='reader',
+                                         email='reader@foodgram.ru')
+        cls.lonely = User.objects.create(username='lonely',
+                                         email='lonely@foodgram.ru')
+        cls.tag = Tag.objects.create(name='Ужин', color='#8775D2',
+                                     slug='dinner')
+        now = timezone.now()
+        for number in range(24):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', author=authors[number % 4],
+                image='backend-media/recipes/images/recipe.png',
+                text='Описание', cooking_time=10,
+            )
+            if number % 3:
+                TagRecipe.objects.create(recipe=recipe, tag=cls.tag)
+        # По три рецепта с одной датой: курсор проходит их смещением.
+        for recipe in Recipe.objects.all():
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=now - timedelta(minutes=recipe.pk // 3)
+            )
+        for author in authors[:2]:
+            Follow.objects.create(user=cls.reader, following=author)
+        cls.followed = Recipe.objects.filter(author__in=authors[:2])
+
+    def feed(self, user, query=''):
+        """id рецептов всех страниц ленты по ссылкам next."""
+        client = APIClient()
+        client.force_authenticate(user)
+        url, ids = f'/api/recipes/feed/?limit=4{query}', []
+        while url:
+            page = client.get(url).json()
+            ids.extend(recipe['id'] for recipe in page['results'])
+            url = page['next']
+        return ids
+
+    def expected(self, recipes):
+        return list(recipes.order_by('-pub_date', '-id').values_list(
+            'id', flat=True
+        ))
+
+    def test_feed_pages(self):
+        for max_authors in (100, 1):
+            with self.subTest(max_authors=max_authors), mock.patch(
+                'recipes.models.FEED_MERGE_MAX_AUTHORS', max_authors
+            ):
+                self.assertEqual(self.feed(self.reader),
+                                 self.expected(self.followed))
+                self.assertEqual(
+                    self.feed(self.reader, '&tags=dinner'),
+                    self.expected(self.followed.filter(tags=self.tag)),
+                )
+
+    def test_empty_feed(self):
+        self.assertEqual(self.feed(self.lonely), [])
+
+
+class MetricsAggregationTest(SimpleTestCase):
+    """Метрики воркеров из METRICS_DIR складываются с метриками процесса."""
+
+    labels = ('metrics-test', 'GET')
+
+    @override_settings(METRICS_DIR='')
+    def setUp(self):
+        REPEATED_QUERIES.inc(self.labels)
+
+    def test_other_workers_are_summed(self):
+        counts = [0] * (len(REQUEST_DURATION.buckets) + 1)
+        counts[0] = 2
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            with open(os.path.join(metrics_dir, 'worker.json'), 'w') as file:
+                json.dump({
+                    REQUEST_DURATION.name: [[self.labels, [counts, 2, 0.004]]],
+                    REPEATED_QUERIES.name: [[self.labels, 2]],
+                }, file)
+            with override_settings(METRICS_DIR=metrics_dir):
+                lines = render_metrics().splitlines()
+        labels = 'view="metrics-test",method="GET"'
+        self.assertIn(
+            f'foodgram_repeated_queries_total{{{labels}}} '
+            f'{REPEATED_QUERIES.series[self.labels] + 2}',
+            lines,
+        )
+        self.assertIn(
+            f'foodgram_request_duration_seconds_count{{{labels}}} 2', lines
+        )
+        self.assertIn(
+            f'foodgram_request_duration_seconds_bucket{{{labels},le="+Inf"}}'
+            ' 2', lines
+        )
+
+    def test_exited_worker_is_folded(self):
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            for name in ('101-a.json', '102-b.json'):
+                with open(os.path.join(metrics_dir, name), 'w') as file:
+                    json.dump({REPEATED_QUERIES.name: [[self.labels, 2]]},
+                              file)
+            with override_settings(METRICS_DIR=metrics_dir):
+                before = collect_series()[REPEATED_QUERIES.name]
+                fold_worker_metrics(metrics_dir, 101)
+                fold_worker_metrics(metrics_dir, 102)
+                after = collect_series()[REPEATED_QUERIES.name]
+            files = sorted(
+                name for name in os.listdir(metrics_dir)
+                if name.endswith('.json')
+            )
+        self.assertEqual(files, [AGGREGATE_FILE])
+        self.assertEqual(after[self.labels], before[self.labels])
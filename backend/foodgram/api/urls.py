@@ -1,9 +1,16 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework import routers
 
+from api.async_views import (RecipeReadView, ReferenceDetailView,
+                             ReferenceListView, ShoppingCartView)
+from api.filters import IngredientFilter
+from api.serializers import IngredientSerializer, TagSerializer
 from api.views import (CustomUserViewSet, IngredientViewSet,
                        ListSubscribeViewSet, RecipeViewSet, TagViewSet,
-                       download_shopping_cart, favorite, shopping, subscribe)
+                       download_shopping_cart, favorite, metrics, shopping,
+                       subscribe)
+from recipes.models import Ingredient, Tag
 
 router_v1 = routers.DefaultRouter()
 
@@ -20,9 +27,57 @@ function_urls = [
     path('recipes/<int:recipe_id>/favorite/', favorite, name='favorite'),
     path('users/<int:user_id>/subscribe/', subscribe, name='subscribe'),
     path('recipes/<int:recipe_id>/shopping_cart/', shopping, name='shopping'),
+    path('metrics/', metrics, name='metrics'),
 
 ]
 
+async_urls = [
+    path('recipes/download_shopping_cart/',
+         ShoppingCartView.as_view(sync_view=download_shopping_cart),
+         name='download_shopping_cart'),
+    path('recipes/',
+         RecipeReadView.as_view(sync_view=RecipeViewSet.as_view(
+             {'get': 'list', 'post': 'create'}
+         )),
+         name='recipes-list'),
+    path('recipes/<int:pk>/',
+         RecipeReadView.as_view(sync_view=RecipeViewSet.as_view(
+             {'get': 'retrieve', 'put': 'update',
+              'patch': 'partial_update', 'delete': 'destroy'}
+         )),
+         name='recipes-detail'),
+    path('tags/',
+         ReferenceListView.as_view(
+             model=Tag, serializer_class=TagSerializer,
+             cache_namespace='tags',
+             sync_view=TagViewSet.as_view({'get': 'list'}),
+         ),
+         name='tags-list'),
+    path('tags/<int:pk>/',
+         ReferenceDetailView.as_view(
+             model=Tag, serializer_class=TagSerializer,
+             sync_view=TagViewSet.as_view({'get': 'retrieve'}),
+         ),
+         name='tags-detail'),
+    path('ingredients/',
+         ReferenceListView.as_view(
+             model=Ingredient, serializer_class=IngredientSerializer,
+             filterset_class=IngredientFilter,
+             cache_namespace='ingredients',
+             sync_view=IngredientViewSet.as_view({'get': 'list'}),
+         ),
+         name='ingredients-list'),
+    path('ingredients/<int:pk>/',
+         ReferenceDetailView.as_view(
+             model=Ingredient, serializer_class=IngredientSerializer,
+             sync_view=IngredientViewSet.as_view({'get': 'retrieve'}),
+         ),
+         name='ingredients-detail'),
+]
+
+if settings.ASGI_MODE:
+    function_urls = async_urls + function_urls
+
 urlpatterns = [
     path('', include(function_urls)),
     path('', include(router_v1.urls)),
@@ -1,46 +1,78 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, OuterRef, Value
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, Sum, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.conf import settings
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
-from rest_framework.filters import SearchFilter
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from api.autocomplete import ingredient_autocomplete
+from api.bulk import RecipeBulkCreator
+from api.cache import get_recipe_cache_stats
 from api.filters import IngredientFilter, RecipeFilter
+from api.metrics import CONTENT_TYPE, render_metrics
+from api.pagination import (RecipeCoveragePagination, RecipeCursorPagination,
+                            RecipePagination)
+from api.parsers import BulkJSONParser, NDJSONParser
 from api.permissions import IsAuthor
-from api.serializers import (CustomUserSerializer, FavoriteSerializer,
-                             FollowSerializer, IngredientRecipe,
-                             IngredientSerializer, RecipeSerializer,
-                             RecipeWriteSerializer, ShoppingCardSerializer,
-                             TagSerializer)
-from api.viewsets import ListRetriveViewSet, ListViewSet
+from api.serializers import (BulkParamsSerializer, CustomUserSerializer,
+                             FavoriteSerializer, FollowSerializer,
+                             IngredientAutocompleteSerializer,
+                             IngredientCoverageParamsSerializer,
+                             IngredientRecipe, IngredientSerializer,
+                             RecipeCoverageSerializer, RecipeSerializer,
+                             RecipeShortSerializer, RecipeWriteSerializer,
+                             ShoppingCardSerializer,
+                             SimilarRecipesParamsSerializer, TagSerializer,
+                             get_recipes_limit)
+from api.viewsets import (AnonymousRecipeCacheMixin, CachedReferenceViewSet,
+                          ListViewSet)
+from recipes.memberships import get_memberships
 from recipes.models import (Favorite, Follow, Ingredient, Recipe, ShoppingList,
-                            Tag)
+                            SimilarRecipe, Tag)
 
 User = get_user_model()
+SHOPPING_CART_DISPOSITION = 'attachment; filename=shopping-list.txt'
 
 
-class IngredientViewSet(ListRetriveViewSet):
+class IngredientViewSet(CachedReferenceViewSet):
     """Ингредиенты."""
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (DjangoFilterBackend, SearchFilter)
+    cache_namespace = 'ingredients'
+    filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    @action(["get"], detail=False)
+    def autocomplete(self, request):
+        """Автодополнение из индекса в памяти без запроса к базе."""
+        serializer = IngredientAutocompleteSerializer(
+            data=request.query_params
+        )
+        serializer.is_valid(raise_exception=True)
+        return Response(ingredient_autocomplete.search(
+            serializer.validated_data['name'],
+            serializer.validated_data.get('limit'),
+        ))
 
-class TagViewSet(ListRetriveViewSet):
+
+class TagViewSet(CachedReferenceViewSet):
     """Теги."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    cache_namespace = 'tags'
 
 
 class CustomUserViewSet(UserViewSet):
@@ -54,6 +86,8 @@ class CustomUserViewSet(UserViewSet):
         """Получить контекст."""
         context = super().get_serializer_context()
         context["request"] = self.request
+        if self.request.user.is_authenticated:
+            context['memberships'] = get_memberships(self.request.user)
         return context
 
     def get_serializer_class(self):
@@ -74,30 +108,25 @@ class CustomUserViewSet(UserViewSet):
         return self.retrieve(request, *args, **kwargs)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousRecipeCacheMixin, viewsets.ModelViewSet):
     """Рецепты."""
 
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
     ordering = ('-pub_date',)
+    lookup_value_regex = r'\d+'
 
     def get_queryset(self):
-        """Получить кверисет."""
-        user = self.request.user
-        if user.is_authenticated:
-            return Recipe.objects.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
-                ),
-                is_in_shopping_cart=Exists(
-                    ShoppingList.objects.filter(user=user,
-                                                recipe=OuterRef('pk'))
-                )
-            ).all()
-        return Recipe.objects.annotate(
-            is_favorited=Value(False),
-            is_in_shopping_cart=Value(False)
-        ).all()
+        """Получить кверисет.
+
+        Флаги авторизованного пользователя берутся из его множеств
+        в контексте сериализатора, без подзапросов EXISTS.
+        """
+        queryset = Recipe.objects.with_related()
+        if self.request.user.is_authenticated:
+            return queryset
+        return queryset.with_user_flags(self.request.user)
 
     def get_serializer_class(self):
         """Получить сериализатор."""
@@ -107,10 +136,97 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def get_permissions(self):
         """Проверка доступа."""
+        if self.action in ('bulk', 'cache_stats'):
+            return (permissions.IsAdminUser(),)
+        if self.action == 'feed':
+            return (permissions.IsAuthenticated(),)
         if self.request.method in permissions.SAFE_METHODS:
             return (permissions.AllowAny(),)
         return (permissions.IsAuthenticated(), IsAuthor(),)
 
+    @action(["post"], detail=False,
+            parser_classes=(BulkJSONParser, NDJSONParser))
+    def bulk(self, request):
+        """Пакетное создание рецептов из JSON-массива или NDJSON."""
+        if not isinstance(request.data, list):
+            return Response(
+                {'errors': 'Ожидается массив рецептов.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = BulkParamsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        report = RecipeBulkCreator(
+            request.user,
+            context=self.get_serializer_context(),
+            **serializer.validated_data,
+        ).run(request.data)
+        return Response(report, status=status.HTTP_200_OK)
+
+    @action(["get"], detail=False, pagination_class=RecipeCursorPagination)
+    def feed(self, request):
+        """Лента рецептов авторов из подписок, новые первыми."""
+        queryset = self.filter_queryset(
+            self.get_queryset().feed(request.user)
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(["get"], detail=False,
+            pagination_class=RecipeCoveragePagination)
+    def by_ingredients(self, request):
+        """Рецепты по покрытию имеющихся ингредиентов.
+
+        Страница ранжируется агрегацией по id, затем рецепты страницы
+        загружаются обычным кверисетом со связанными объектами.
+        """
+        params = IngredientCoverageParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        ranked = self.filter_queryset(
+            Recipe.objects.all()
+        ).by_ingredient_coverage(
+            params.validated_data['ingredients']
+        ).values('id', 'ingredients_matched', 'ingredients_missing')
+        page = self.paginate_queryset(ranked)
+        recipes = self.get_queryset().in_bulk(item['id'] for item in page)
+        for item in page:
+            recipe = recipes[item['id']]
+            recipe.ingredients_matched = item['ingredients_matched']
+            recipe.ingredients_missing = item['ingredients_missing']
+        serializer = RecipeCoverageSerializer(
+            [recipes[item['id']] for item in page],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(["get"], detail=True)
+    def similar(self, request, pk):
+        """Похожие рецепты из таблицы, рассчитанной build_similar.
+
+        Соседи читаются одним запросом по индексу (recipe, score).
+        """
+        params = SimilarRecipesParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        recipes = [
+            item.similar for item in SimilarRecipe.objects.filter(
+                recipe_id=pk
+            ).select_related('similar').order_by(
+                '-score'
+            )[:params.validated_data['limit']]
+        ]
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        serializer = RecipeShortSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(["get"], detail=False)
+    def cache_stats(self, request):
+        """Попадания и промахи кеша ответов для анонимов."""
+        return Response(get_recipe_cache_stats())
+
     def perform_create(self, serializer):
         """Добавить автора."""
         serializer.save(author=self.request.user)
@@ -119,6 +235,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Получить контекст."""
         context = super().get_serializer_context()
         context["request"] = self.request
+        if self.request.user.is_authenticated:
+            context['memberships'] = get_memberships(self.request.user)
         return context
 
 
@@ -129,9 +247,27 @@ class ListSubscribeViewSet(ListViewSet):
     ordering = ('id',)
 
     def get_queryset(self):
-        """Получить кверисет."""
-        user = self.request.user
-        return user.follower.all()
+        """Получить кверисет.
+
+        Последние рецепты всех авторов страницы загружаются одним
+        запросом с ROW_NUMBER() OVER (PARTITION BY author_id).
+        """
+        recipes = Recipe.objects.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
+        ).order_by('-pub_date', '-id')
+        recipes_limit = get_recipes_limit(self.request)
+        if recipes_limit:
+            recipes = recipes.filter(row_number__lte=recipes_limit)
+        return self.request.user.follower.select_related(
+            'following'
+        ).prefetch_related(
+            Prefetch('following__recipes', queryset=recipes,
+                     to_attr='latest_recipes')
+        ).order_by('id')
 
     def get_serializer_context(self):
         """Получить контекст."""
@@ -140,6 +276,21 @@ class ListSubscribeViewSet(ListViewSet):
         return context
 
 
+def save_membership(serializer, **kwargs):
+    """Сохранить связь, дубль от параллельного запроса - ответ 400.
+
+    Два одновременных POST могут оба пройти validate, тогда второй
+    упирается в уникальное ограничение.
+    """
+    try:
+        with transaction.atomic():
+            serializer.save(**kwargs)
+    except IntegrityError:
+        raise ValidationError({
+            api_settings.NON_FIELD_ERRORS_KEY: [serializer.duplicate_message]
+        })
+
+
 @api_view(["POST", "DELETE"])
 @permission_classes([IsAuthenticated])
 def favorite(request, recipe_id):
@@ -151,7 +302,7 @@ def favorite(request, recipe_id):
         )
         serializer.is_valid(raise_exception=True)
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        serializer.save(user=request.user, recipe=recipe)
+        save_membership(serializer, user=request.user, recipe=recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     serializer = FavoriteSerializer(
         data=request.data,
@@ -179,7 +330,7 @@ def subscribe(request, user_id):
             context={'request': request, 'user_id': user_id}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user, following=following)
+        save_membership(serializer, user=request.user, following=following)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     serializer = FollowSerializer(
         data=request.data,
@@ -203,7 +354,7 @@ def shopping(request, recipe_id):
             context={'request': request, 'recipe_id': recipe_id}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user,
+        save_membership(serializer, user=request.user,
                         recipe=get_object_or_404(Recipe, id=recipe_id))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     serializer = ShoppingCardSerializer(
@@ -222,21 +373,36 @@ def shopping(request, recipe_id):
 @permission_classes([IsAuthenticated])
 def download_shopping_cart(request):
     """Скачать список покупок."""
-    ingredients = IngredientRecipe.objects.filter(
-        recipe__shopping_recipe__user=request.user
+    response = StreamingHttpResponse(
+        (shopping_cart_line(item)
+         for item in shopping_cart_ingredients(request.user).iterator()),
+        content_type='text/plain',
+        status=status.HTTP_200_OK,
     )
-    shopping_data = {}
-    for ingredient in ingredients:
-        if str(ingredient.ingredient) in shopping_data:
-            shopping_data[f'{str(ingredient.ingredient)}'] += ingredient.amount
-        else:
-            shopping_data[f'{str(ingredient.ingredient)}'] = ingredient.amount
-    filename = "shopping-list.txt"
-    content = ''
-    for ingredient, amount in shopping_data.items():
-        content += f"{ingredient} - {amount};\n"
-    response = HttpResponse(content, content_type='text/plain',
-                            status=status.HTTP_200_OK)
-    response['Content-Disposition'] = 'attachment; filename={0}'.format(
-        filename)
+    response['Content-Disposition'] = SHOPPING_CART_DISPOSITION
     return response
+
+
+def shopping_cart_ingredients(user):
+    """Суммы ингредиентов из списка покупок пользователя."""
+    return IngredientRecipe.objects.filter(
+        recipe__shopping_recipe__user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    ).annotate(
+        total=Sum('amount')
+    ).order_by('ingredient__name')
+
+
+def shopping_cart_line(item):
+    """Строка файла списка покупок."""
+    return (f"{item['ingredient__name']}, "
+            f"{item['ingredient__measurement_unit']} - {item['total']};\n")
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAdminUser])
+def metrics(request):
+    """Метрики профилирования процесса в формате Prometheus."""
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
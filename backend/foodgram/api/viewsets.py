@@ -1,4 +1,41 @@
-from rest_framework import mixins, viewsets
+from urllib.parse import urlencode
+
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework import mixins, status, viewsets
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import get_recipe_entry, get_reference_entry
+
+
+def reference_response(request, etag, body):
+    """Ответ справочника из кеша или 304 по If-None-Match."""
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def anonymous_cache_query(request):
+    """Хост и отсортированные параметры запроса для ключа кеша."""
+    query = urlencode(sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values
+    ))
+    return f'{request.get_host()}?{query}'
+
+
+def cached_recipe_response(body, hit):
+    """Ответ из кеша рецептов с заголовком X-Cache."""
+    response = HttpResponse(body, content_type='application/json')
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
 
 
 class ListRetriveViewSet(
@@ -16,3 +53,72 @@ class ListViewSet(
 ):
     """Вьюсет только list."""
     pass
+
+
+class CachedReferenceViewSet(ListRetriveViewSet):
+    """Вьюсет справочника с кешированным списком и ETag.
+
+    Готовый JSON списка хранится в кеше под текущей версией справочника
+    cache_namespace, версия меняется сигналами при изменении данных.
+    """
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        """Отдать список из кеша или ответить 304."""
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        query = request.query_params.urlencode()
+        etag, body = get_reference_entry(
+            self.cache_namespace,
+            '&'.join(sorted(query.split('&'))),
+            lambda: JSONRenderer().render(
+                super(CachedReferenceViewSet, self).list(
+                    request, *args, **kwargs
+                ).data
+            ),
+        )
+        return reference_response(request, etag, body)
+
+
+class AnonymousRecipeCacheMixin:
+    """Кеш готовых ответов list/retrieve рецептов для анонимов.
+
+    У анонимов флаги избранного, покупок и подписки всегда False,
+    поэтому ответ зависит только от хоста, параметров запроса
+    и данных рецептов. Версии кеша меняются сигналами api.signals.
+    """
+
+    def list(self, request, *args, **kwargs):
+        """Отдать список рецептов из кеша."""
+        return self._cached_response(
+            None, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Отдать рецепт из кеша."""
+        return self._cached_response(
+            kwargs[self.lookup_url_kwarg or self.lookup_field],
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def _cached_response(self, recipe_id, handler, request, *args, **kwargs):
+        """Вызвать handler при промахе и закешировать ответ 200."""
+        if (request.user.is_authenticated
+                or request.accepted_renderer.format != 'json'):
+            return handler(request, *args, **kwargs)
+        response = None
+
+        def render():
+            nonlocal response
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return None
+            return JSONRenderer().render(response.data)
+
+        body, hit = get_recipe_entry(
+            recipe_id, anonymous_cache_query(request), render
+        )
+        if body is None:
+            return response
+        return cached_recipe_response(body, hit)
@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.SQLProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +59,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+# Включается в foodgram/asgi.py: асинхронные представления для чтения
+# и новое соединение на запрос, потому что под ASGI синхронный код
+# каждого запроса выполняется в своем потоке и постоянное соединение
+# не переиспользуется.
+ASGI_MODE = os.getenv('ASGI_MODE') == 'True'
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE'),
@@ -65,7 +72,28 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': (0 if ASGI_MODE
+                         else int(os.getenv('DB_CONN_MAX_AGE', 60))),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS',
+                                        'True') == 'True',
+        # PgBouncer в режиме transaction отдает каждую транзакцию
+        # любому серверному соединению, курсоры WITH HOLD не переживут
+        # переключения.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER') == 'True',
+    }
+}
+
+# LocMemCache подходит только для одного процесса: в docker-compose.yml
+# по умолчанию задан Redis, а gunicorn.conf.py с локальным кешем
+# запускает один воркер.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -100,6 +128,40 @@ MEDIA_URL = '/backend_media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend_media')
 
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 5 * 1024 * 1024))
+
+RECIPE_IMAGE_WIDTHS = (320, 640, 1280)
+
+RECIPE_IMAGE_FORMATS = ('WEBP', 'JPEG')
+
+RECIPE_IMAGE_QUALITY = 80
+
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+
+# Предел тела запроса: фото в base64 и остальные поля рецепта.
+# Парсеры API проверяют его по Content-Length, а пакетная загрузка
+# ограничена RECIPE_BULK_MAX_SIZE, как client_max_body_size в nginx.
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 1024 * 1024
+
+RECIPE_BULK_MAX_SIZE = int(os.getenv('RECIPE_BULK_MAX_SIZE',
+                                     512 * 1024 * 1024))
+
+RECIPE_TRENDING_HALF_LIFE_HOURS = float(
+    os.getenv('RECIPE_TRENDING_HALF_LIFE_HOURS', 48)
+)
+
+RECIPE_TRENDING_WINDOW_DAYS = int(os.getenv('RECIPE_TRENDING_WINDOW_DAYS', 14))
+
+RECIPE_SIMILAR_TOP_K = int(os.getenv('RECIPE_SIMILAR_TOP_K', 10))
+
+RECIPE_RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', 300)
+)
+
+USER_MEMBERSHIPS_CACHE_TIMEOUT = int(
+    os.getenv('USER_MEMBERSHIPS_CACHE_TIMEOUT', 60 * 60)
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -107,8 +169,38 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPageNumberPagination',
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.JSONParser',
+        'api.parsers.FormParser',
+        'api.parsers.MultiPartParser',
+    ],
 }
 
 DJOSER = {
     'LOGIN_FIELD': 'email'
 }
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.01))
+
+PROFILING_N_PLUS_ONE_THRESHOLD = int(
+    os.getenv('PROFILING_N_PLUS_ONE_THRESHOLD', 5)
+)
+
+# Папка, где воркеры gunicorn складывают метрики для /api/metrics/.
+# Без нее метрики остаются в памяти процесса.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.middleware': {
+            'handlers': ['console'],
+            'level': os.getenv('PROFILING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,91 @@
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# Настройки gunicorn из окружения, значения по умолчанию подобраны
+# командой benchmark_gunicorn. gunicorn читает этот файл из рабочей
+# папки сам, параметры командной строки имеют приоритет.
+CPU_COUNT = multiprocessing.cpu_count()
+
+# Кеш в памяти процесса у каждого воркера свой: сброс версий
+# справочников, кеша рецептов и множеств пользователя дошел бы только
+# до воркера, принявшего запись. С ним запускается один воркер.
+LOCAL_CACHE = 'locmem' in os.getenv('CACHE_BACKEND', 'locmem')
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+workers = (1 if LOCAL_CACHE
+           else int(os.getenv('GUNICORN_WORKERS', CPU_COUNT * 2 + 1)))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Потоки ждут базу и медленных клиентов, не занимая процессор.
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+wsgi_app = 'foodgram.wsgi:application'
+if worker_class == 'uvicorn':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'foodgram.asgi:application'
+
+# Приложение загружается в мастере до fork: воркеры стартуют быстрее
+# и делят с мастером память импортированного кода.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+# Перезапуск воркера после max_requests запросов ограничивает рост
+# памяти, разброс не дает воркерам перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER',
+                                    max_requests // 10))
+
+# nginx принимает тело запроса целиком и только потом передает его
+# gunicorn, поэтому таймаут покрывает разбор фото рецепта, а не его
+# загрузку, и совпадает с proxy_read_timeout nginx.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Пульс воркеров в памяти, а не на диске контейнера.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Воркеры пишут метрики в общую папку, /api/metrics/ складывает их:
+# иначе каждый воркер отдавал бы Prometheus свою долю запросов.
+METRICS_DIR = os.environ.setdefault('METRICS_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+    'foodgram-metrics',
+))
+
+
+def on_starting(server):
+    """Обнулить метрики прошлого запуска сервера."""
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    os.makedirs(METRICS_DIR)
+
+
+def when_ready(server):
+    """Предупредить, что воркер один из-за локального кеша."""
+    if LOCAL_CACHE:
+        server.log.warning('CACHE_BACKEND хранит кеш в памяти процесса, '
+                           'запущен один воркер; задайте общий кеш, '
+                           'например Redis.')
+
+
+def pre_fork(server, worker):
+    """Подготовить мастер с загруженным приложением к fork.
+
+    Воркеры не получают соединений с базой, открытых мастером, а
+    объекты мастера убираются из сборки мусора: иначе ее проходы
+    в воркерах копируют общие страницы памяти.
+    """
+    if server.cfg.preload_app:
+        from django.db import connections
+        connections.close_all()
+        gc.freeze()
+
+
+def worker_exit(server, worker):
+    """Дописать метрики воркера перед выходом."""
+    from api.metrics import flush_metrics
+    flush_metrics()
+
+
+def child_exit(server, worker):
+    """Перенести метрики завершенного воркера в общий файл."""
+    from api.metrics import fold_worker_metrics
+    fold_worker_metrics(METRICS_DIR, worker.pid)
@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.db.models import Count, OuterRef
 
-from recipes.models import Favorite, Ingredient, Recipe, Tag
+from recipes.images import schedule_renditions
+from recipes.models import Ingredient, Recipe, Tag
 
 
 class TagsInline(admin.TabularInline):
@@ -72,7 +72,7 @@ class RecipeAdmin(admin.ModelAdmin):
         'id',
         'name',
         'author',
-        'favorite_count',
+        'favorites_count',
     )
     inlines = (
         TagsInline,
@@ -84,10 +84,10 @@ class RecipeAdmin(admin.ModelAdmin):
         'image',
         'text',
         'cooking_time',
-        'favorite_count',
+        'favorites_count',
     )
     readonly_fields = (
-        'favorite_count',
+        'favorites_count',
     )
     list_filter = (
         'author',
@@ -95,16 +95,24 @@ class RecipeAdmin(admin.ModelAdmin):
         'tags',
     )
 
-    def get_queryset(self, request):
-        return Recipe.objects.annotate(
-            favorite_count=Count(
-                Favorite.objects.filter(recipe=OuterRef('pk')).values('id')
-            )
-        )
-
-    @admin.display(
-        ordering='favorite_count',
-        description='Количество добавлений в избранное',
-    )
-    def favorite_count(self, obj):
-        return obj.favorite_count
+    def save_model(self, request, obj, form, change):
+        """Сохранить рецепт и поставить в очередь копии нового фото.
+
+        При изменении пишутся только поля формы: счетчики меняются
+        выражениями F() и сверкой, устаревшие значения объекта не
+        должны их перезаписать.
+        """
+        image_changed = 'image' in form.changed_data
+        stale_renditions = None
+        if not change:
+            obj.save()
+        else:
+            update_fields = [name for name in self.fields
+                             if name not in self.readonly_fields]
+            if image_changed:
+                stale_renditions = obj.image_renditions
+                obj.image_renditions = {}
+                update_fields.append('image_renditions')
+            obj.save(update_fields=update_fields)
+        if image_changed:
+            schedule_renditions(obj, stale_renditions)
@@ -0,0 +1,50 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Follow, Recipe, ShoppingList
+from users.models import User
+
+COUNTERS = {
+    Favorite: ((Recipe, 'recipe_id', 'favorites_count'),),
+    ShoppingList: ((Recipe, 'recipe_id', 'shopping_count'),),
+    Recipe: ((User, 'author_id', 'recipes_count'),),
+    Follow: ((User, 'following_id', 'followers_count'),),
+}
+
+
+def change_counters(instance, delta):
+    """Изменить счетчики, связанные с объектом, одним UPDATE на счетчик."""
+    for model, attname, field in COUNTERS[type(instance)]:
+        model.objects.filter(pk=getattr(instance, attname)).update(
+            **{field: Greatest(F(field) + delta, 0)}
+        )
+
+
+def reconcile_counters(ids=None):
+    """Пересчитать счетчики по фактическим данным.
+
+    ids ограничивает пересчет словарем {модель: id объектов}.
+    Возвращает количество исправленных строк для каждого счетчика.
+    """
+    result = {}
+    for related, counters in COUNTERS.items():
+        for model, attname, field in counters:
+            actual = Coalesce(Subquery(
+                related.objects.filter(
+                    **{attname: OuterRef('pk')}
+                ).order_by().values(attname).annotate(
+                    total=Count('pk')
+                ).values('total')
+            ), 0)
+            queryset = model.objects.all()
+            if ids is not None:
+                if model not in ids:
+                    continue
+                queryset = queryset.filter(pk__in=ids[model])
+            drifted = queryset.annotate(actual=actual).exclude(
+                **{field: F('actual')}
+            ).values_list('pk', flat=True)
+            result[f'{model._meta.label}.{field}'] = model.objects.filter(
+                pk__in=drifted
+            ).update(**{field: actual})
+    return result
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from api.cache import bump_recipe_versions
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITION_EXTENSIONS = {
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Получить пул потоков обработки фото.
+
+    Пул создается лениво, чтобы не переживать fork воркеров gunicorn.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+        return _executor
+
+
+def schedule_renditions(recipe, stale=None):
+    """Поставить построение копий фото в очередь после коммита.
+
+    stale - прежние копии, которые нужно удалить после замены.
+    """
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: get_executor().submit(
+            build_renditions_safely, recipe_id, image_name, stale
+        )
+    )
+
+
+def build_renditions_safely(recipe_id, image_name, stale=None):
+    """Построить копии фото в фоновом потоке."""
+    try:
+        build_renditions(recipe_id, image_name, stale)
+    except Exception:
+        logger.exception('Не удалось обработать фото рецепта %s', recipe_id)
+    finally:
+        connection.close()
+
+
+def _render(image, width, image_format):
+    """Уменьшить фото до ширины и сохранить в заданном формате."""
+    rendition = image.copy()
+    rendition.thumbnail((width, image.height))
+    if image_format == 'JPEG' and rendition.mode != 'RGB':
+        rendition = rendition.convert('RGB')
+    buffer = BytesIO()
+    rendition.save(buffer, image_format,
+                   quality=settings.RECIPE_IMAGE_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def delete_renditions(renditions):
+    """Удалить файлы копий фото."""
+    for names in renditions.values():
+        for name in names.values():
+            default_storage.delete(name)
+
+
+def build_renditions(recipe_id, image_name, stale=None):
+    """Сохранить уменьшенные копии фото рецепта и записать их пути.
+
+    Если фото рецепта за это время сменилось, копии удаляются.
+    """
+    with default_storage.open(image_name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+    widths = [
+        width for width in settings.RECIPE_IMAGE_WIDTHS
+        if width < image.width
+    ] or [image.width]
+    stem = os.path.splitext(image_name)[0]
+    renditions = {}
+    for image_format in settings.RECIPE_IMAGE_FORMATS:
+        extension = RENDITION_EXTENSIONS[image_format]
+        for width in widths:
+            renditions.setdefault(extension, {})[str(width)] = (
+                default_storage.save(
+                    f'{stem}_{width}.{extension}',
+                    _render(image, width, image_format),
+                )
+            )
+    if not Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        image_renditions=renditions
+    ):
+        delete_renditions(renditions)
+        return None
+    bump_recipe_versions([recipe_id])
+    if stale:
+        delete_renditions(stale)
+    return renditions
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import build_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Команда для построения уменьшенных копий фото рецептов
+    Вызов python3 manage.py build_renditions
+    из терминала в соответствующей папке
+    """
+
+    help = 'Построение уменьшенных копий фото рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить копии и для уже обработанных рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_renditions={})
+        total = 0
+        for recipe_id, image_name, stale in recipes.values_list(
+            'id', 'image', 'image_renditions'
+        ):
+            try:
+                build_renditions(recipe_id, image_name, stale)
+                total += 1
+            except Exception as error:
+                self.stderr.write(f'Ошибка при обработке фото рецепта '
+                                  f'{recipe_id}. Текст - {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано фото рецептов: {total}'
+        ))
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.similarity import METRICS, build_similar_recipes
+
+
+class Command(BaseCommand):
+    """Команда для расчета похожих рецептов
+    Вызов python3 manage.py build_similar
+    из терминала в соответствующей папке.
+    Без --all считает только новые рецепты и дополняет ими
+    сохраненные списки соседей.
+    """
+
+    help = 'Расчет похожих рецептов по ингредиентам и тегам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать соседей всех рецептов.',
+        )
+        parser.add_argument(
+            '--metric',
+            choices=METRICS,
+            default='cosine',
+            help='Мера сходства векторов ингредиентов и тегов.',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=settings.RECIPE_SIMILAR_TOP_K,
+            help='Сколько похожих рецептов хранить для каждого.',
+        )
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        if options['top_k'] < 1:
+            raise CommandError('top-k должен быть положительным.')
+        start = time.perf_counter()
+        total = build_similar_recipes(
+            options['top_k'], options['metric'], rebuild=options['all']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рассчитаны похожие для {total} рецептов за '
+            f'{time.perf_counter() - start:.2f} с'
+        ))
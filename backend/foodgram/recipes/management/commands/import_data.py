@@ -1,30 +1,327 @@
+import csv
 import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
-from recipes.models import Ingredient
+from api.cache import bump_recipe_versions, bump_reference_version
+from recipes.counters import reconcile_counters
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag, TagRecipe
+from recipes.search import update_search_vectors
+from users.models import User
+
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+TAG_FIELDS = ('name', 'color', 'slug')
+RECIPE_FIELDS = ('name', 'text', 'cooking_time', 'tags', 'ingredients')
+RECIPE_INGREDIENT_FIELDS = ('name', 'amount')
+
+
+def iter_json_array(file):
+    """Потоково читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    whitespace = ' \t\r\n,'
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив.')
+    position = 1
+    while True:
+        while position < len(buffer) and buffer[position] in whitespace:
+            position += 1
+        if buffer[position:position + 1] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON-массив.')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_records(path, fields=None):
+    """Читает записи из JSON, NDJSON или CSV файла."""
+    suffix = Path(path).suffix.lower()
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if suffix == '.csv':
+            if fields is None:
+                raise CommandError(f'CSV не поддерживается для {path}.')
+            for row in csv.reader(file):
+                if row:
+                    yield dict(zip(fields, row))
+        elif suffix in ('.ndjson', '.jsonl'):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(file)
+
+
+def check_fields(item, fields, label):
+    """Проверить, что в записи есть все обязательные поля."""
+    if not isinstance(item, dict):
+        raise CommandError(f'{label}: ожидается объект, получено {item!r}.')
+    missing = [field for field in fields if field not in item]
+    if missing:
+        raise CommandError(f'{label}: нет полей {", ".join(missing)}.')
+
+
+def batched(iterable, size):
+    """Разбить итератор на пачки заданного размера."""
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
 
 
 class Command(BaseCommand):
-    """Команда для импорта ингредиетов в базу
+    """Команда для импорта ингредиентов, тегов и рецептов в базу.
     Вызов python3 manage.py import_data
-    из терминала в соответствующей папке
+    из терминала в соответствующей папке.
+    Без параметров загружает ingredients.json из текущей папки.
     """
 
-    help = 'Импорт ингредиентов'
+    help = 'Импорт ингредиентов, тегов и рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            help='Файл ингредиентов (.json, .ndjson или .csv).',
+        )
+        parser.add_argument(
+            '--tags',
+            help='Файл тегов (.json, .ndjson или .csv).',
+        )
+        parser.add_argument(
+            '--recipes',
+            help='Файл рецептов (.json или .ndjson).',
+        )
+        parser.add_argument(
+            '--author',
+            help='Email автора для рецептов без поля author.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество записей в одной пачке.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Прочитать и проверить файлы и ссылки рецептов на '
+                 'авторов, теги и ингредиенты, не записывая в базу.',
+        )
 
     def handle(self, *args, **options):
         """Тело команды."""
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть положительным.')
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        # Без записи в базу ингредиенты и теги из файлов этого запуска
+        # учитываются при проверке ссылок рецептов по этим множествам.
+        self.pending_ingredients = set()
+        self.pending_tags = set()
+        if not any(options[key] for key in ('ingredients', 'tags',
+                                            'recipes')):
+            options['ingredients'] = 'ingredients.json'
+        if options['ingredients']:
+            self._run('Ингредиенты', self._import_ingredients,
+                      iter_records(options['ingredients'], INGREDIENT_FIELDS),
+                      INGREDIENT_FIELDS)
+            if not self.dry_run:
+                bump_reference_version('ingredients')
+        if options['tags']:
+            self._run('Теги', self._import_tags,
+                      iter_records(options['tags'], TAG_FIELDS), TAG_FIELDS)
+            if not self.dry_run:
+                bump_reference_version('tags')
+        if options['recipes']:
+            self.default_author = options['author']
+            self.authors = set()
+            self._run('Рецепты', self._import_recipes,
+                      iter_records(options['recipes']), RECIPE_FIELDS)
+            if not self.dry_run:
+                reconcile_counters({User: self.authors})
+                bump_recipe_versions(everything=True)
+
+    def _run(self, title, importer, records, fields):
+        """Загрузить записи пачками и вывести производительность.
+
+        В режиме --dry-run импортер проверяет пачку теми же запросами
+        на чтение, но ничего не записывает.
+        """
+        start = time.perf_counter()
+        total = 0
+        for batch in batched(records, self.batch_size):
+            for number, item in enumerate(batch, total + 1):
+                label = f'{title}, запись {number}'
+                if isinstance(item, dict) and 'name' in item:
+                    label += f' ({item["name"]})'
+                check_fields(item, fields, label)
+            if self.dry_run:
+                importer(batch)
+            else:
+                with transaction.atomic():
+                    importer(batch)
+            total += len(batch)
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed else total
+        prefix = '[dry-run] ' if self.dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}{title}: {total} записей за {elapsed:.2f} с '
+            f'({rate:.0f} записей/с)'
+        ))
+
+    def _import_ingredients(self, batch):
+        """Вставить или обновить пачку ингредиентов."""
+        unique = {item['name']: item for item in batch}
+        if self.dry_run:
+            self.pending_ingredients.update(unique)
+            return
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=item['name'],
+                        measurement_unit=item['measurement_unit'])
+             for item in unique.values()],
+            update_conflicts=True,
+            unique_fields=('name',),
+            update_fields=('measurement_unit',),
+        )
+
+    def _import_tags(self, batch):
+        """Вставить или обновить пачку тегов."""
+        unique = {item['slug']: item for item in batch}
+        if self.dry_run:
+            self.pending_tags.update(unique)
+            return
+        Tag.objects.bulk_create(
+            [Tag(name=item['name'], color=item['color'], slug=item['slug'])
+             for item in unique.values()],
+            update_conflicts=True,
+            unique_fields=('slug',),
+            update_fields=('name', 'color'),
+        )
+
+    def _import_recipes(self, batch):
+        """Вставить или обновить пачку рецептов вместе со связями."""
+        unique = {item['name']: item for item in batch}
+        authors = dict(User.objects.filter(
+            email__in={item.get('author', self.default_author)
+                       for item in unique.values()}
+        ).values_list('email', 'id'))
+        for item in unique.values():
+            email = item.get('author', self.default_author)
+            if email not in authors:
+                raise CommandError(
+                    f'Автор {email} рецепта {item["name"]} не найден.'
+                )
+        tag_ids, ingredient_ids = self._resolve_recipe_links(unique)
+        if self.dry_run:
+            return
+        self.authors.update(authors.values())
+        Recipe.objects.bulk_create(
+            [Recipe(
+                name=item['name'],
+                author_id=authors[item.get('author', self.default_author)],
+                text=item['text'],
+                cooking_time=item['cooking_time'],
+                image=item.get('image', ''),
+            ) for item in unique.values()],
+            update_conflicts=True,
+            unique_fields=('name',),
+            update_fields=('author', 'text', 'cooking_time', 'image'),
+        )
+        recipe_ids = dict(Recipe.objects.filter(
+            name__in=unique
+        ).values_list('name', 'id'))
+        self._import_recipe_links(unique, recipe_ids, tag_ids,
+                                  ingredient_ids)
+
+    def _resolve_recipe_links(self, recipes):
+        """Найти id тегов и ингредиентов пачки рецептов.
+
+        Неизвестный тег или ингредиент - ошибка, кроме записанных
+        в этом же запуске с --dry-run.
+        """
+        for name, item in recipes.items():
+            for ingredient in item['ingredients']:
+                check_fields(ingredient, RECIPE_INGREDIENT_FIELDS,
+                             f'Рецепт {name}, ингредиент')
+        tag_ids = dict(Tag.objects.filter(slug__in={
+            slug for item in recipes.values() for slug in item['tags']
+        }).values_list('slug', 'id'))
+        ingredient_ids = dict(Ingredient.objects.filter(name__in={
+            ingredient['name']
+            for item in recipes.values()
+            for ingredient in item['ingredients']
+        }).values_list('name', 'id'))
+        for name, item in recipes.items():
+            for slug in item['tags']:
+                if slug not in tag_ids and slug not in self.pending_tags:
+                    raise CommandError(f'Тег {slug} рецепта {name} '
+                                       'не найден.')
+            for ingredient in item['ingredients']:
+                if (ingredient['name'] not in ingredient_ids
+                        and ingredient['name']
+                        not in self.pending_ingredients):
+                    raise CommandError(
+                        f'Ингредиент {ingredient["name"]} рецепта {name} '
+                        'не найден.'
+                    )
+        return tag_ids, ingredient_ids
 
-        with open('ingredients.json', 'r') as file:
-            data = json.load(file)
+    def _import_recipe_links(self, recipes, recipe_ids, tag_ids,
+                             ingredient_ids):
+        """Записать теги и ингредиенты пачки рецептов.
 
-        for note in data:
-            try:
-                Ingredient.objects.get_or_create(**note)
-                print(f"{note['name']} в базе")
-            except Exception as error:
-                print(f"Ошибка при добавлении {note['name']}.\n"
-                      f"Текст - {error}")
+        Связи уже существующих рецептов, которых нет в файле, удаляются
+        в той же транзакции, так что повторный импорт заменяет состав.
+        """
+        tags = {}
+        ingredients = {}
+        for name, item in recipes.items():
+            recipe_id = recipe_ids[name]
+            for slug in item['tags']:
+                tags[recipe_id, tag_ids[slug]] = TagRecipe(
+                    recipe_id=recipe_id, tag_id=tag_ids[slug]
+                )
+            for ingredient in item['ingredients']:
+                ingredient_id = ingredient_ids[ingredient['name']]
+                ingredients[recipe_id, ingredient_id] = IngredientRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=ingredient['amount'],
+                )
+        self._delete_stale_links(TagRecipe, 'tag_id', recipe_ids.values(),
+                                 tags)
+        self._delete_stale_links(IngredientRecipe, 'ingredient_id',
+                                 recipe_ids.values(), ingredients)
+        TagRecipe.objects.bulk_create(tags.values(), ignore_conflicts=True)
+        IngredientRecipe.objects.bulk_create(
+            ingredients.values(),
+            update_conflicts=True,
+            unique_fields=('recipe', 'ingredient'),
+            update_fields=('amount',),
+        )
+        update_search_vectors(recipe_ids.values())
 
-        print('Загрузка ингредиентов завершена')
+    def _delete_stale_links(self, model, field, recipe_ids, links):
+        """Удалить связи рецептов пачки, которых нет среди links."""
+        stale = [
+            pk for pk, recipe_id, related_id in model.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('pk', 'recipe_id', field)
+            if (recipe_id, related_id) not in links
+        ]
+        if stale:
+            model.objects.filter(pk__in=stale).delete()
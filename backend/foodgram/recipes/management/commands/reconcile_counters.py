@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    """Команда для пересчета денормализованных счетчиков
+    Вызов python3 manage.py reconcile_counters
+    из терминала в соответствующей папке
+    """
+
+    help = 'Пересчет счетчиков избранного, покупок, рецептов и подписчиков'
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        with transaction.atomic():
+            result = reconcile_counters()
+        for counter, fixed in result.items():
+            self.stdout.write(f'{counter}: исправлено {fixed}')
+        self.stdout.write(self.style.SUCCESS('Пересчет счетчиков завершен'))
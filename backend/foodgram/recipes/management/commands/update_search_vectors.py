@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import is_full_text_supported, update_search_vectors
+
+
+class Command(BaseCommand):
+    """Команда для пересчета поисковых векторов рецептов
+    Вызов python3 manage.py update_search_vectors
+    из терминала в соответствующей папке
+    """
+
+    help = 'Пересчет поисковых векторов рецептов'
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        if not is_full_text_supported():
+            self.stdout.write('Полнотекстовый поиск доступен только '
+                              'в PostgreSQL, пересчет не нужен.')
+            return
+        updated = update_search_vectors()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено поисковых векторов: {updated}'
+        ))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import bump_recipe_versions
+from recipes.trending import update_trending_scores
+
+
+class Command(BaseCommand):
+    """Команда для пересчета рейтинга рецептов в трендах
+    Вызов python3 manage.py update_trending
+    из терминала в соответствующей папке.
+    Предназначена для периодического запуска, например из cron.
+    """
+
+    help = 'Пересчет затухающего рейтинга избранного и покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--half-life',
+            type=float,
+            help='Период полураспада события в часах.',
+        )
+        parser.add_argument(
+            '--window',
+            type=int,
+            help='Учитывать события за столько последних дней.',
+        )
+
+    def handle(self, *args, **options):
+        """Тело команды."""
+        for key in ('half_life', 'window'):
+            if options[key] is not None and options[key] <= 0:
+                raise CommandError('Параметры должны быть положительными.')
+        start = time.perf_counter()
+        updated = update_trending_scores(
+            half_life_hours=options['half_life'],
+            window_days=options['window'],
+        )
+        bump_recipe_versions()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг обновлен у {updated} рецептов за '
+            f'{time.perf_counter() - start:.2f} с'
+        ))
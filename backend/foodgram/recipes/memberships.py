@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Value
+
+from api.cache import bump_reference_version, get_reference_version
+from recipes.models import Favorite, Follow, ShoppingList
+
+MEMBERSHIPS = {
+    Favorite: ('favorites', 'recipe_id'),
+    ShoppingList: ('cart', 'recipe_id'),
+    Follow: ('follows', 'following_id'),
+}
+MEMBERSHIPS_NAMESPACE = 'memberships:{user_id}'
+MEMBERSHIPS_KEY = 'memberships:{user_id}:{version}'
+
+
+def load_memberships(user_id):
+    """Загрузить множества пользователя одним запросом UNION ALL."""
+    memberships = {kind: set() for kind, _ in MEMBERSHIPS.values()}
+    querysets = [
+        model.objects.filter(user_id=user_id).annotate(
+            kind=Value(kind)
+        ).values_list('kind', attname)
+        for model, (kind, attname) in MEMBERSHIPS.items()
+    ]
+    for kind, target_id in querysets[0].union(*querysets[1:], all=True):
+        memberships[kind].add(target_id)
+    return memberships
+
+
+def get_memberships(user):
+    """Получить избранное, список покупок и подписки пользователя.
+
+    Множества id хранятся в кеше Django, поэтому работают с локальным
+    и с Redis-бэкендом. При промахе загружаются из базы. Ключ включает
+    версию, прочитанную до загрузки: множества, загруженные до коммита
+    параллельной записи, ложатся под прежнюю версию и не читаются.
+    """
+    version = get_reference_version(
+        MEMBERSHIPS_NAMESPACE.format(user_id=user.pk)
+    )
+    key = MEMBERSHIPS_KEY.format(user_id=user.pk, version=version)
+    memberships = cache.get(key)
+    if memberships is None:
+        memberships = load_memberships(user.pk)
+        cache.set(key, memberships,
+                  timeout=settings.USER_MEMBERSHIPS_CACHE_TIMEOUT)
+    return memberships
+
+
+def reset_memberships(instance):
+    """Сменить версию множеств пользователя после коммита записи."""
+    bump_reference_version(
+        MEMBERSHIPS_NAMESPACE.format(user_id=instance.user_id)
+    )
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:38
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+PATTERN_INDEX = 'ingredient_name_lower_pattern_idx'
+
+
+def create_pattern_index(apps, schema_editor):
+    """Индекс для LIKE 'prefix%' в PostgreSQL при любой локали базы."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {PATTERN_INDEX} '
+        'ON recipes_ingredient (lower(name) varchar_pattern_ops)'
+    )
+
+
+def drop_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {PATTERN_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_alter_tag_color'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='ingredient_name_lower_idx'),
+        ),
+        migrations.RunPython(create_pattern_index, drop_pattern_index),
+    ]
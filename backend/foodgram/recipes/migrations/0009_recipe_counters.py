@@ -0,0 +1,45 @@
+# Generated by Django 4.2.1 on 2026-10-18 18:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('Recipe', 'shopping_count', 'ShoppingList', 'recipe'),
+    ('User', 'recipes_count', 'Recipe', 'author'),
+    ('User', 'followers_count', 'Follow', 'following'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, related_name, lookup in COUNTERS:
+        app_label = 'users' if model_name == 'User' else 'recipes'
+        model = apps.get_model(app_label, model_name)
+        related = apps.get_model('recipes', related_name)
+        model.objects.update(**{field: Coalesce(Subquery(
+            related.objects.filter(**{lookup: OuterRef('pk')}).order_by(
+            ).values(lookup).annotate(total=Count('pk')).values('total')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_ingredient_name_lower_idx'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в список покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
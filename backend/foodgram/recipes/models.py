@@ -1,6 +1,9 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
 
 from users.models import User
 
@@ -22,6 +25,9 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['id']
+        indexes = (
+            models.Index(Lower('name'), name='ingredient_name_lower_idx'),
+        )
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
@@ -61,6 +67,149 @@ class Tag(models.Model):
         return f'{self.name}'
 
 
+# При большем числе подписок их рецепты идут в индексе даты достаточно
+# плотно, и обход с EXISTS дешевле объединения срезов по авторам
+# (замер benchmark_feed). SQLite принимает не больше 500 частей UNION.
+FEED_MERGE_MAX_AUTHORS = 100
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._feed_user = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._feed_user = self._feed_user
+        return clone
+
+    def __getitem__(self, k):
+        """Срез ленты собирается из срезов по авторам, см. feed()."""
+        if (isinstance(k, slice) and k.stop is not None
+                and self._feed_user is not None
+                and self._result_cache is None):
+            return self._merge_authors(k.stop)[k]
+        return super().__getitem__(k)
+
+    def with_related(self):
+        """Подгрузить связанные объекты фиксированным числом запросов."""
+        return self.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredientrecipe_set',
+                queryset=IngredientRecipe.objects.select_related('ingredient'),
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """Аннотировать флаги избранного, покупок и подписки на автора."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+                author_is_subscribed=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(user=user,
+                                        recipe=models.OuterRef('pk'))
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingList.objects.filter(user=user,
+                                            recipe=models.OuterRef('pk'))
+            ),
+            author_is_subscribed=models.Exists(
+                Follow.objects.filter(user=user,
+                                      following=models.OuterRef('author'))
+            ),
+        )
+
+    def feed(self, user):
+        """Рецепты авторов, на которых подписан пользователь.
+
+        Без среза база идет по индексу pub_date и проверяет подписку
+        EXISTS для каждого рецепта. Срез [:n] с фильтрами, курсором
+        и сортировкой кверисета берет по n рецептов каждого автора
+        из индекса (author, pub_date, id) и объединяет их UNION ALL:
+        число прочитанных строк не зависит от доли рецептов подписок.
+        При подписке больше чем на FEED_MERGE_MAX_AUTHORS авторов срез
+        читается обходом индекса даты.
+        """
+        queryset = self.filter(models.Exists(
+            Follow.objects.filter(user=user,
+                                  following=models.OuterRef('author'))
+        ))
+        queryset._feed_user = user
+        return queryset
+
+    def _merge_authors(self, limit):
+        """Оставить рецепты из первых limit каждого автора подписок.
+
+        Подзапрос автора компилируется дважды, для остальных авторов
+        в готовом SQL меняются только параметры с id автора.
+        """
+        queryset = self._chain()
+        queryset._feed_user = None
+        authors = list(Follow.objects.filter(
+            user=self._feed_user
+        ).values_list('following_id', flat=True)[:FEED_MERGE_MAX_AUTHORS + 1])
+        if not authors:
+            return queryset.none()
+        if len(authors) > FEED_MERGE_MAX_AUTHORS:
+            return queryset
+        sql, params = queryset._author_part(authors[0], limit)
+        slots = []
+        if len(authors) > 1:
+            other = queryset._author_part(authors[1], limit)[1]
+            slots = [index for index, (first, second)
+                     in enumerate(zip(params, other)) if first != second]
+        column = connections[self.db].ops.quote_name(
+            self.model._meta.pk.column
+        )
+        parts, union_params = [], []
+        for number, author in enumerate(authors):
+            parts.append(f'SELECT feed_{number}.{column} '
+                         f'FROM ({sql}) feed_{number}')
+            part_params = list(params)
+            for index in slots:
+                part_params[index] = author
+            union_params.extend(part_params)
+        return queryset.filter(pk__in=RawSQL(' UNION ALL '.join(parts),
+                                             union_params))
+
+    def _author_part(self, author, limit):
+        """SQL и параметры первых limit рецептов автора."""
+        return self.filter(
+            author_id=author
+        ).values('pk')[:limit].query.sql_with_params()
+
+    def by_ingredient_coverage(self, ingredient_ids):
+        """Рецепты хотя бы с одним из ингредиентов по покрытию набора.
+
+        Сначала полностью покрытые, затем с наименьшим числом
+        недостающих ингредиентов. Совпадения считаются агрегацией
+        по индексу ingredient_id, всего ингредиентов - подзапросом
+        по индексу (recipe, ingredient).
+        """
+        total = IngredientRecipe.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            total=models.Count('pk')
+        ).values('total')
+        return self.filter(
+            ingredientrecipe__ingredient__in=ingredient_ids
+        ).annotate(
+            ingredients_matched=models.Count('ingredientrecipe'),
+            ingredients_missing=(models.Subquery(total)
+                                 - models.F('ingredients_matched')),
+        ).order_by('ingredients_missing', '-ingredients_matched',
+                   '-pub_date', '-id')
+
+
 class Recipe(models.Model):
     """Рецепт"""
 
@@ -79,6 +228,12 @@ class Recipe(models.Model):
         'Фото блюда',
         upload_to='backend-media/recipes/images/',
     )
+    image_renditions = models.JSONField(
+        'Уменьшенные копии фото',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(
         'Рецепт',
     )
@@ -105,9 +260,39 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True,
     )
+    favorites_count = models.PositiveIntegerField(
+        'Количество добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+    shopping_count = models.PositiveIntegerField(
+        'Количество добавлений в список покупок',
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        'Рейтинг в трендах',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=('-favorites_count', '-pub_date', '-id'),
+                         name='recipe_popular_idx'),
+            models.Index(fields=('-trending_score', '-pub_date', '-id'),
+                         name='recipe_trending_idx'),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -165,6 +350,9 @@ class TagRecipe(models.Model):
                 name='unique_recipe_tag',
             ),
         )
+        indexes = (
+            models.Index(fields=('tag', 'recipe'), name='tag_recipe_idx'),
+        )
 
     def __str__(self):
         return f"{self.tag} для {self.recipe}"
@@ -212,6 +400,11 @@ class Favorite(models.Model):
         related_name='favorite_user',
         on_delete=models.CASCADE
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         constraints = (
@@ -220,6 +413,10 @@ class Favorite(models.Model):
                 name='unique_favorite'
             ),
         )
+        indexes = (
+            models.Index(fields=('user', 'recipe'),
+                         name='favorite_user_recipe_idx'),
+        )
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
 
@@ -240,6 +437,11 @@ class ShoppingList(models.Model):
         related_name='shopping_user',
         on_delete=models.CASCADE
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         constraints = (
@@ -248,8 +450,45 @@ class ShoppingList(models.Model):
                 name='unique_shopping_list'
             ),
         )
+        indexes = (
+            models.Index(fields=('user', 'recipe'),
+                         name='shopping_user_recipe_idx'),
+        )
         verbose_name = 'Рецепт в списке покупок'
         verbose_name_plural = 'Рецепты в списке покупок'
 
     def __str__(self) -> str:
         return f'{self.recipe} в списке покупок у {self.user}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт, рассчитанный командой build_similar."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='similar_recipes',
+        on_delete=models.CASCADE,
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe',
+            ),
+        )
+        indexes = (
+            models.Index(fields=('recipe', '-score'),
+                         name='similar_recipe_score_idx'),
+        )
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+    def __str__(self) -> str:
+        return f'{self.similar} похож на {self.recipe}'
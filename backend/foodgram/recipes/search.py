@@ -0,0 +1,71 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import IngredientRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+
+
+def is_full_text_supported():
+    """Проверить, поддерживает ли база полнотекстовый поиск PostgreSQL."""
+    return connection.vendor == 'postgresql'
+
+
+def recipe_search_vector():
+    """Выражение tsvector рецепта: название, ингредиенты и текст."""
+    ingredient_names = Subquery(
+        IngredientRecipe.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(ingredient_names, Value(''), output_field=TextField()),
+            weight='B', config=SEARCH_CONFIG,
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipes=None):
+    """Пересчитать сохраненный tsvector рецептов одним UPDATE.
+
+    recipes - кверисет или список id, по умолчанию все рецепты.
+    В базах без полнотекстового поиска ничего не делает.
+    """
+    if not is_full_text_supported():
+        return 0
+    queryset = Recipe.objects.all()
+    if recipes is not None:
+        queryset = queryset.filter(pk__in=recipes)
+    return queryset.update(search_vector=recipe_search_vector())
+
+
+def search_recipes(queryset, text):
+    """Отфильтровать рецепты по тексту, сортируя по релевантности.
+
+    В PostgreSQL используется индексированный tsvector и SearchRank,
+    в остальных базах - поиск подстроки без ранжирования. LIKE в SQLite
+    не различает регистр только у латиницы, поэтому там кириллица
+    ищется с учетом регистра.
+    """
+    if is_full_text_supported():
+        query = SearchQuery(text, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date')
+    return queryset.filter(
+        Q(name__icontains=text)
+        | Q(text__icontains=text)
+        | Exists(IngredientRecipe.objects.filter(
+            recipe=OuterRef('pk'), ingredient__name__icontains=text
+        ))
+    )
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.counters import COUNTERS, change_counters
+from recipes.memberships import MEMBERSHIPS, reset_memberships
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+from recipes.search import update_search_vectors
+
+
+def increase_counters(sender, instance, created, raw=False, **kwargs):
+    """Увеличить денормализованные счетчики при создании объекта."""
+    if created and not raw:
+        change_counters(instance, 1)
+
+
+def decrease_counters(sender, instance, **kwargs):
+    """Уменьшить денормализованные счетчики при удалении объекта."""
+    change_counters(instance, -1)
+
+
+# Подписка только на модели со счетчиками, чтобы удаление остальных
+# моделей оставалось быстрым DELETE без загрузки объектов.
+for model in COUNTERS:
+    post_save.connect(increase_counters, sender=model)
+    post_delete.connect(decrease_counters, sender=model)
+
+
+def add_membership(sender, instance, created, raw=False, **kwargs):
+    """Сбросить множества пользователя после добавления связи."""
+    if created and not raw:
+        reset_memberships(instance)
+
+
+def remove_membership(sender, instance, **kwargs):
+    """Сбросить множества пользователя после удаления связи."""
+    reset_memberships(instance)
+
+
+for model in MEMBERSHIPS:
+    post_save.connect(add_membership, sender=model)
+    post_delete.connect(remove_membership, sender=model)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, raw=False, **kwargs):
+    """Пересчитать поисковый вектор рецепта после коммита.
+
+    К этому моменту сохранены и ингредиенты рецепта: запись через API
+    и админку выполняется в одной транзакции.
+    """
+    if not raw:
+        transaction.on_commit(lambda: update_search_vectors([instance.pk]))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_vectors(sender, instance, created, raw=False,
+                                     **kwargs):
+    """Пересчитать поисковые векторы рецептов с измененным ингредиентом."""
+    if not created and not raw:
+        transaction.on_commit(lambda: update_search_vectors(
+            IngredientRecipe.objects.filter(
+                ingredient=instance
+            ).values('recipe')
+        ))
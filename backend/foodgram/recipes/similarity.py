@@ -0,0 +1,185 @@
+import heapq
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from recipes.models import IngredientRecipe, Recipe, SimilarRecipe, TagRecipe
+
+METRICS = ('cosine', 'jaccard')
+TAG_WEIGHT = 0.5
+# Оценка ненулевых элементов блока сходства одной пачки строк:
+# около 12 байт на элемент CSR, то есть порядка 100 МБ.
+NNZ_BUDGET = 8_000_000
+INSERT_BATCH_SIZE = 5000
+
+
+class IncidenceMatrix:
+    """Разреженная матрица рецепт x (ингредиенты + теги)."""
+
+    def __init__(self):
+        self.recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        self.rows = {pk: row for row, pk in enumerate(self.recipe_ids)}
+        ingredients = self._pairs(IngredientRecipe, 'ingredient_id')
+        tags = self._pairs(TagRecipe, 'tag_id')
+        columns = {}
+        row_indexes, column_indexes, weights = [], [], []
+        for pairs, prefix, weight in ((ingredients, 'i', 1.0),
+                                      (tags, 't', TAG_WEIGHT)):
+            for recipe_id, feature_id in pairs:
+                row_indexes.append(self.rows[recipe_id])
+                column_indexes.append(
+                    columns.setdefault((prefix, feature_id), len(columns))
+                )
+                weights.append(weight)
+        self.matrix = sparse.csr_matrix(
+            (weights, (row_indexes, column_indexes)),
+            shape=(len(self.recipe_ids), len(columns)),
+        )
+
+    @staticmethod
+    def _pairs(model, attname):
+        """Пары (рецепт, признак) из связующей таблицы."""
+        return model.objects.values_list('recipe_id', attname).iterator()
+
+    def similarities(self, rows, metric):
+        """Сходство рецептов rows со всеми рецептами пачками строк.
+
+        Пачки подбираются по оценке ненулевых элементов блока, а не по
+        числу строк: теги есть у большинства рецептов, и блок почти
+        плотный. Возвращает пары (номера строк пачки, матрица CSR).
+        """
+        if metric == 'cosine':
+            norms = np.sqrt(self.matrix.multiply(self.matrix).sum(axis=1)).A1
+            norms[norms == 0] = 1
+            vectors = sparse.diags(1 / norms) @ self.matrix
+        else:
+            vectors = (self.matrix > 0).astype(np.float64)
+            sizes = vectors.sum(axis=1).A1
+        vectors = vectors.tocsr()
+        transposed = vectors.T.tocsr()
+        for chunk in self._chunks(rows, vectors):
+            block = vectors[chunk] @ transposed
+            if metric == 'jaccard':
+                union = sizes[block.indices]
+                union += np.repeat(sizes[chunk], np.diff(block.indptr))
+                union -= block.data
+                block.data /= union
+            yield chunk, block
+
+    @staticmethod
+    def _chunks(rows, vectors):
+        """Пачки строк с оценкой ненулевых блока не больше NNZ_BUDGET.
+
+        Оценка строки - сумма частот ее признаков, но не больше числа
+        рецептов. Строка дороже бюджета идет отдельной пачкой.
+        """
+        present = (vectors > 0).astype(np.int64)
+        popularity = present.sum(axis=0).A1
+        costs = np.minimum(present[rows] @ popularity, vectors.shape[0])
+        totals = np.cumsum(costs)
+        start = 0
+        while start < len(rows):
+            spent = totals[start - 1] if start else 0
+            end = max(start + 1, int(np.searchsorted(
+                totals, spent + NNZ_BUDGET, side='right'
+            )))
+            yield rows[start:end]
+            start = end
+
+
+def top_neighbors(block, chunk, top_k):
+    """Top-K соседей каждой строки пачки без самого рецепта."""
+    for index, row in enumerate(chunk):
+        start, end = block.indptr[index], block.indptr[index + 1]
+        columns = block.indices[start:end]
+        scores = block.data[start:end]
+        keep = (columns != row) & (scores > 0)
+        columns, scores = columns[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            columns, scores = columns[best], scores[best]
+        yield row, list(zip(columns.tolist(), scores.tolist()))
+
+
+def build_similar_recipes(top_k, metric='cosine', rebuild=False):
+    """Рассчитать похожие рецепты и сохранить top-K в SimilarRecipe.
+
+    Без rebuild считаются только рецепты без сохраненных соседей,
+    а новые рецепты добавляются в списки уже рассчитанных, если
+    вытесняют их последнего соседа. Возвращает число рассчитанных
+    рецептов.
+    """
+    incidence = IncidenceMatrix()
+    if not incidence.recipe_ids:
+        return 0
+    if rebuild:
+        targets = set(incidence.recipe_ids)
+    else:
+        targets = set(Recipe.objects.exclude(
+            pk__in=SimilarRecipe.objects.values('recipe')
+        ).values_list('pk', flat=True))
+    rows = np.array(sorted(incidence.rows[pk] for pk in targets),
+                    dtype=np.int64)
+    stored_rows = np.ones(len(incidence.recipe_ids), dtype=bool)
+    stored_rows[rows] = False
+    neighbors = {}
+    candidates = defaultdict(list)
+    for chunk, block in incidence.similarities(rows, metric):
+        neighbors.update(top_neighbors(block, chunk, top_k))
+        if rebuild:
+            continue
+        block_rows = np.repeat(chunk, np.diff(block.indptr))
+        keep = stored_rows[block.indices] & (block.data > 0)
+        for row, column, score in zip(block_rows[keep].tolist(),
+                                      block.indices[keep].tolist(),
+                                      block.data[keep].tolist()):
+            candidates[column].append((row, score))
+    updated = {
+        row: found for row, found in _merge_candidates(
+            incidence, candidates, top_k
+        )
+    }
+    updated.update(neighbors)
+    ids = incidence.recipe_ids
+    with transaction.atomic():
+        if rebuild:
+            SimilarRecipe.objects.all().delete()
+        else:
+            SimilarRecipe.objects.filter(
+                recipe_id__in=[ids[row] for row in updated]
+            ).delete()
+        SimilarRecipe.objects.bulk_create(
+            (SimilarRecipe(recipe_id=ids[row], similar_id=ids[column],
+                           score=score)
+             for row, found in updated.items()
+             for column, score in found),
+            batch_size=INSERT_BATCH_SIZE,
+        )
+    return len(neighbors)
+
+
+def _merge_candidates(incidence, candidates, top_k):
+    """Добавить новые рецепты в сохраненные списки соседей.
+
+    Сходство симметрично, поэтому кандидаты берутся из уже
+    посчитанных строк новых рецептов без пересчета старых.
+    """
+    stored = defaultdict(list)
+    for recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+        recipe_id__in=[incidence.recipe_ids[row] for row in candidates]
+    ).values_list('recipe_id', 'similar_id', 'score').iterator():
+        stored[incidence.rows[recipe_id]].append(
+            (incidence.rows[similar_id], score)
+        )
+    for row, found in candidates.items():
+        current = stored[row]
+        threshold = (min(score for _, score in current)
+                     if len(current) >= top_k else 0)
+        new = [item for item in found if item[1] > threshold]
+        if new:
+            yield row, heapq.nlargest(top_k, current + new,
+                                      key=lambda item: item[1])
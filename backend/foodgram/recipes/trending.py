@@ -0,0 +1,62 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, ShoppingList
+
+TRENDING_EVENTS = (Favorite, ShoppingList)
+UPDATE_BATCH_SIZE = 1000
+
+
+def compute_trending_scores(now=None, half_life_hours=None, window_days=None):
+    """Посчитать затухающий рейтинг рецептов по событиям за окно.
+
+    Событие добавления в избранное или список покупок весит
+    0.5 ** (возраст / период полураспада). События агрегируются
+    в базе по часам, затухание считается для каждого часа.
+    """
+    now = now or timezone.now()
+    half_life = timedelta(hours=(
+        half_life_hours or settings.RECIPE_TRENDING_HALF_LIFE_HOURS
+    ))
+    window = timedelta(days=(
+        window_days or settings.RECIPE_TRENDING_WINDOW_DAYS
+    ))
+    scores = defaultdict(float)
+    for model in TRENDING_EVENTS:
+        buckets = model.objects.filter(
+            created__gte=now - window
+        ).annotate(
+            hour=TruncHour('created')
+        ).values('recipe_id', 'hour').annotate(
+            events=Count('pk')
+        ).order_by()
+        for bucket in buckets.iterator():
+            age = max(now - bucket['hour'], timedelta())
+            scores[bucket['recipe_id']] += (
+                bucket['events'] * 0.5 ** (age / half_life)
+            )
+    return scores
+
+
+def update_trending_scores(**kwargs):
+    """Записать рейтинг в индексированную колонку trending_score.
+
+    Рейтинги рецептов без событий за окно обнуляются, запись идет
+    в одной транзакции. Возвращает количество рецептов с рейтингом.
+    """
+    scores = compute_trending_scores(**kwargs)
+    with transaction.atomic():
+        Recipe.objects.filter(trending_score__gt=0).update(trending_score=0)
+        Recipe.objects.bulk_update(
+            (Recipe(pk=pk, trending_score=score)
+             for pk, score in scores.items()),
+            ('trending_score',),
+            batch_size=UPDATE_BATCH_SIZE,
+        )
+    return len(scores)